@@ -0,0 +1,221 @@
+import json
+import logging
+
+from telegram import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+
+logger = logging.getLogger(__name__)
+
+YES_NO = ('Yes', 'No')
+# A partial ballot is stored as one character per answered race: the index of the chosen option.
+CODE_CHARS = '0123456789abcdefghijklmnopqrstuvwxyz'
+# Inline ballots are answered in any order, so races not answered yet hold this placeholder.
+UNANSWERED = '-'
+# Inline ballots: a choice button's callback data is its race's code char then the option's;
+# the review and submit buttons are these single characters.
+CHOICE_PATTERN = f'^[{CODE_CHARS}]{{2}}$'
+REVIEW = 'v'
+SUBMIT = 's'
+RESTART = 'r'
+# Telegram's limit on the buttons in one inline keyboard.
+MAX_INLINE_BUTTONS = 100
+LEADING_COLUMNS = ("Chat ID", "Email", "Name")
+TRAILING_COLUMNS = ("Timestamp",)
+
+DEFAULT_MESSAGES = {
+    'welcome': "Welcome to the Voting Bot. Please enter your registered email:",
+    'already_voted': "You have already voted in this election. Thank you!",
+    'invalid_email': "❌ Invalid email. Try again:",
+    'ask_name': "Enter your full name:",
+    'ask_code': "Enter your verification code:",
+    'invalid_code': "❌ Invalid verification. Try code again:",
+    'verified': "",
+    'recorded': "",
+    'invalid_yes_no': "Vote Yes or No only:",
+    'invalid_choice': "❌ Invalid choice. Choose {choices}:",
+    'complete': "✅ Voting complete. Thank you for participating!",
+    'queued': "✅ Your vote is saved and queued. It will be added to the official record automatically once "
+              "Google Sheets is reachable again; you do not need to vote again.",
+    'summary_line': "• {label}: {vote}",
+    'store_failed': "❌ Could not save vote. Contact admin.",
+    'cancelled': "🚫 Voting cancelled.",
+    'help': "🗳️ Use /start to begin voting or /cancel to stop.",
+    'expired': "⌛ Your voting session expired. Send /start to begin again.",
+    'reminder': "🗳️ Voting is open and you have not voted yet. Send /start to cast your ballot.",
+    'use_buttons': "Please answer with the buttons on your ballot above.",
+    'ballot': "Tap one answer for each question, in any order, then Review.\n\n{races}",
+    'ballot_line': "{number}. {label}",
+    'ballot_answered_line': "{number}. {label}: ✓ {vote}",
+    'ballot_button': "{number} · {choice}",
+    'ballot_chosen_button': "✓ {number} · {choice}",
+    'chosen': "✓ {label}: {vote}",
+    'unanswered': "Still to answer: {numbers}",
+    'review_button': "🔎 Review",
+    'review': "Please check your ballot:\n{summary}\n\nSubmit it? Your vote cannot be changed afterwards.",
+    'submit_button': "✅ Submit",
+    'restart_button': "✏️ Start over",
+}
+
+
+class Race:
+    """One compiled question on the ballot, with its validator and keyboard built once."""
+
+    __slots__ = ('key', 'label', 'column', 'choices', 'valid', 'index', 'number', 'state', 'prompt', 'next_prompt',
+                 'invalid_prompt', 'keyboard', 'inline_rows', 'chosen_rows', '_canonical', '_codes')
+
+    def __init__(self, spec, index, state, number, total, messages):
+        self.key = spec['key']
+        self.label = spec.get('label', self.key)
+        self.column = spec['column']
+        self.choices = tuple(spec['candidates']) if spec.get('type') == 'choice' else YES_NO
+        self._canonical = {choice.casefold(): choice for choice in self.choices}
+        self.valid = frozenset(self._canonical)
+        if len(self.choices) > len(CODE_CHARS):
+            raise ValueError(f"Race {self.key} has more than {len(CODE_CHARS)} options.")
+        self._codes = {choice: CODE_CHARS[i] for i, choice in enumerate(self.choices)}
+        self.index = index
+        self.number = number
+        self.state = state
+        prompt = spec['prompt'].format(number=number, total=total, label=self.label)
+        self.prompt = messages['verified'] + prompt
+        self.next_prompt = messages['recorded'] + prompt
+        if 'invalid' in spec:
+            self.invalid_prompt = spec['invalid'].format(label=self.label)
+        elif self.choices == YES_NO:
+            self.invalid_prompt = messages['invalid_yes_no'].format(label=self.label)
+        else:
+            self.invalid_prompt = messages['invalid_choice'].format(label=self.label, choices=' or '.join(self.choices))
+        self.keyboard = ReplyKeyboardMarkup(
+            [[KeyboardButton(choice) for choice in self.choices]], one_time_keyboard=True, resize_keyboard=True
+        )
+        self.inline_rows = self._inline_rows(messages)
+        # The same rows with one option marked, for a ballot message showing the voter's answer.
+        self.chosen_rows = {choice: self._inline_rows(messages, choice) for choice in self.choices}
+
+    def _inline_rows(self, messages, chosen=None):
+        buttons = [
+            InlineKeyboardButton(
+                messages['ballot_chosen_button' if choice == chosen else 'ballot_button'].format(
+                    number=self.number, choice=choice),
+                callback_data=self.callback_data(choice))
+            for choice in self.choices
+        ]
+        # Short options share a row; longer candidate lists get a row each.
+        return [buttons] if len(buttons) <= 3 else [[b] for b in buttons]
+
+    def parse(self, text):
+        """Return the canonical choice for a voter's reply, or None if it is not valid."""
+        answer = text.strip().casefold()
+        if answer not in self.valid:
+            return None
+        return self._canonical[answer]
+
+    def callback_data(self, choice):
+        return CODE_CHARS[self.index] + self._codes[choice]
+
+    def parse_callback(self, data):
+        """Return the choice an inline button's callback data stands for, or None."""
+        code = CODE_CHARS.index(data[1])
+        return self.choices[code] if code < len(self.choices) else None
+
+    def encode(self, votes, choice):
+        """Return the encoded partial ballot `votes` with this race answered as `choice`."""
+        return votes[:self.index] + self._codes[choice]
+
+    def choose(self, votes, choice):
+        """Return the inline ballot `votes` with this race answered, or re-answered, as `choice`."""
+        return votes[:self.index] + self._codes[choice] + votes[self.index + 1:]
+
+
+class Ballot:
+    """A ballot spec compiled once at startup into conversation states and sheet columns.
+
+    Disabled races keep their sheet column (left blank) so the layout stays stable
+    when a race is withdrawn mid-election.
+    """
+
+    def __init__(self, spec, first_state=3):
+        self.name = spec.get('name', '')
+        self.messages = dict(DEFAULT_MESSAGES, **spec.get('messages', {}))
+        specs = spec['races']
+        enabled = [race for race in specs if race.get('enabled', True)]
+        if len(enabled) > len(CODE_CHARS):
+            raise ValueError(f"A ballot can have at most {len(CODE_CHARS)} races.")
+        self.races = [
+            Race(race, i, first_state + i, i + 1, len(enabled), self.messages) for i, race in enumerate(enabled)
+        ]
+        self.columns = list(LEADING_COLUMNS) + [race['column'] for race in specs] + list(TRAILING_COLUMNS)
+        # An inline ballot is one message answered in a single state, then a review step before it is
+        # submitted. Both are numbered past the longest possible ballot, so every ballot hosted in one
+        # conversation shares them.
+        self.inline_state = first_state + len(CODE_CHARS)
+        self.review_state = self.inline_state + 1
+        self.state_names = {race.state: race.key for race in self.races}
+        self.state_names[self.inline_state] = 'ballot'
+        self.state_names[self.review_state] = 'review'
+        self.blank = UNANSWERED * len(self.races)
+        self.inline_text = self.messages['ballot'].format(races='\n'.join(
+            self.messages['ballot_line'].format(number=race.number, label=race.label) for race in self.races
+        ))
+        rows = [row for race in self.races for row in race.inline_rows]
+        self.inline_buttons = sum(len(row) for row in rows) + 1
+        self._review_row = [InlineKeyboardButton(self.messages['review_button'], callback_data=REVIEW)]
+        self.inline_keyboard = InlineKeyboardMarkup(rows + [self._review_row])
+        self.review_keyboard = InlineKeyboardMarkup([[
+            InlineKeyboardButton(self.messages['submit_button'], callback_data=SUBMIT),
+            InlineKeyboardButton(self.messages['restart_button'], callback_data=RESTART),
+        ]])
+        self.help = self.messages['help'].format(total=len(self.races))
+
+    @classmethod
+    def load(cls, path, first_state=3):
+        with open(path, 'r') as f:
+            ballot = cls(json.load(f), first_state)
+        logger.info(f"Loaded ballot {path} with {len(ballot.races)} races.")
+        return ballot
+
+    def next_race(self, race):
+        index = race.index + 1
+        return self.races[index] if index < len(self.races) else None
+
+    def decode(self, encoded):
+        """Expand an encoded partial ballot into {race key: choice}."""
+        return {
+            race.key: race.choices[CODE_CHARS.index(code)]
+            for race, code in zip(self.races, encoded) if code != UNANSWERED
+        }
+
+    def unanswered(self, encoded):
+        """Races an inline ballot has not answered yet."""
+        return [race for race, code in zip(self.races, encoded) if code == UNANSWERED]
+
+    def inline_view(self, encoded):
+        """Text and keyboard of the inline ballot message showing the answers in `encoded`."""
+        if encoded == self.blank:
+            return self.inline_text, self.inline_keyboard
+        lines, rows = [], []
+        for race, code in zip(self.races, encoded):
+            if code == UNANSWERED:
+                lines.append(self.messages['ballot_line'].format(number=race.number, label=race.label))
+                rows.extend(race.inline_rows)
+            else:
+                vote = race.choices[CODE_CHARS.index(code)]
+                lines.append(self.messages['ballot_answered_line'].format(number=race.number, label=race.label, vote=vote))
+                rows.extend(race.chosen_rows[vote])
+        text = self.messages['ballot'].format(races='\n'.join(lines))
+        return text, InlineKeyboardMarkup(rows + [self._review_row])
+
+    def race_for(self, data):
+        """The race an inline choice button's callback data belongs to, or None."""
+        index = CODE_CHARS.index(data[0])
+        return self.races[index] if index < len(self.races) else None
+
+    def record(self, votes):
+        """Map a voter's {race key: choice} to {sheet column: choice} for every column on the ballot."""
+        return {race.column: votes.get(race.key, '') for race in self.races}
+
+    def summary(self, votes):
+        line = self.messages['summary_line']
+        return '\n'.join(line.format(label=race.label, vote=votes.get(race.key, '')) for race in self.races)
+
+    def review(self, votes):
+        return self.messages['review'].format(summary=self.summary(votes))
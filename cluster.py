@@ -0,0 +1,218 @@
+"""Scale-out: one ingress process shards Telegram updates by chat to worker processes.
+
+main.py runs as the ingress when WORKERS > 1. It receives updates by webhook
+or long polling and forwards each one over a local keep-alive connection to
+worker `chat_id % WORKERS`, so every update from a chat reaches the same
+worker, in order. Workers are ordinary bot processes started with
+WORKER_INDEX set; they share conversation state, the has-voted index and the
+ballot database through SQLite, and never write to the sheet.
+"""
+import asyncio
+import json
+import logging
+import os
+import secrets
+import signal
+import sys
+import time
+from urllib.parse import urlsplit
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+FORWARDED = REGISTRY.counter(
+    'election_ingress_forwarded_total', 'Updates forwarded to scale-out workers, by worker.', ('worker',))
+FORWARD_FAILURES = REGISTRY.counter(
+    'election_ingress_forward_failures_total', 'Updates a worker did not accept after retrying, by worker.', ('worker',))
+WORKER_RESTARTS = REGISTRY.counter(
+    'election_worker_restarts_total', 'Worker processes restarted after exiting, by worker.', ('worker',))
+
+
+def update_chat_id(data):
+    """The chat (or, failing that, user) ID of a raw Telegram update, or None."""
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        user = value.get('from') or value.get('user')
+        if user:
+            return user['id']
+    return None
+
+
+class WebhookLink:
+    """Keeps one HTTP/1.1 connection to a webhook open and posts updates over it like Telegram does."""
+
+    def __init__(self, url, secret=None):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path or '/'
+        self.secret = secret
+        self._reader = None
+        self._writer = None
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+    async def post(self, update):
+        """Send one update and return the HTTP status code."""
+        if self._writer is None:
+            await self._connect()
+        body = json.dumps(update).encode()
+        headers = [
+            f"POST {self.path} HTTP/1.1",
+            f"Host: {self.host}:{self.port}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+        ]
+        if self.secret:
+            headers.append(f"X-Telegram-Bot-Api-Secret-Token: {self.secret}")
+        self._writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode() + body)
+        await self._writer.drain()
+        status_line = await self._reader.readline()
+        length = 0
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode().partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        if length:
+            await self._reader.readexactly(length)
+        return int(status_line.split()[1])
+
+    async def close(self):
+        if self._writer is not None:
+            writer, self._writer = self._writer, None
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+
+class WorkerProcess:
+    """One worker process, restarted if it exits, and the connection updates are forwarded over."""
+
+    def __init__(self, index, count, port, path, secret, forward_timeout=15):
+        self.index = index
+        self.count = count
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.forward_timeout = forward_timeout
+        self.process = None
+        self._link = WebhookLink(f"http://127.0.0.1:{port}{path}", secret)
+        self._lock = asyncio.Lock()
+        self._stopping = False
+        self._task = None
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.returncode is None
+
+    async def _spawn(self):
+        env = dict(
+            os.environ, WORKER_INDEX=str(self.index), WORKER_COUNT=str(self.count), PORT=str(self.port),
+            WEBHOOK_PATH=self.path, WEBHOOK_SECRET=self.secret,
+        )
+        self.process = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(sys.argv[0]), env=env)
+        logger.info(f"Started worker {self.index} (pid {self.process.pid}) on port {self.port}.")
+
+    async def _supervise(self):
+        while True:
+            code = await self.process.wait()
+            if self._stopping:
+                return
+            WORKER_RESTARTS.inc(str(self.index))
+            logger.error(f"Worker {self.index} exited with {code}, restarting.")
+            await asyncio.sleep(1)
+            await self._spawn()
+
+    async def start(self):
+        await self._spawn()
+        self._task = asyncio.get_running_loop().create_task(self._supervise())
+
+    async def forward(self, data):
+        """Post one update to the worker, retrying while it starts up or restarts. Returns success."""
+        deadline = time.monotonic() + self.forward_timeout
+        delay = 0.1
+        async with self._lock:
+            while True:
+                try:
+                    status = await self._link.post(data)
+                    if status == 200:
+                        FORWARDED.inc(str(self.index))
+                        return True
+                    logger.warning(f"Worker {self.index} answered {status}.")
+                except (OSError, IndexError, ValueError, asyncio.IncompleteReadError):
+                    await self._link.close()
+                if time.monotonic() + delay > deadline:
+                    FORWARD_FAILURES.inc(str(self.index))
+                    return False
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 2)
+
+    async def stop(self, timeout=20):
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+        await self._link.close()
+        if self.alive:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                await asyncio.wait_for(self.process.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Worker {self.index} did not stop in {timeout}s, killing it.")
+                self.process.kill()
+                await self.process.wait()
+
+
+class Ingress:
+    """Starts the workers and routes each update to the worker that owns its chat."""
+
+    def __init__(self, count, base_port, path='/telegram'):
+        secret = secrets.token_urlsafe(24)
+        self.workers = [WorkerProcess(i, count, base_port + i, path, secret) for i in range(count)]
+
+    @property
+    def ready(self):
+        return all(worker.alive for worker in self.workers)
+
+    def worker_for(self, data):
+        chat_id = update_chat_id(data)
+        return self.workers[chat_id % len(self.workers) if chat_id is not None else 0]
+
+    async def dispatch(self, data):
+        return await self.worker_for(data).forward(data)
+
+    async def start(self):
+        for worker in self.workers:
+            await worker.start()
+
+    async def stop(self):
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+
+
+async def poll_updates(bot, ingress, allowed_updates, timeout=30, retry_interval=5):
+    """Long-poll Telegram and dispatch updates; an update is only acknowledged once a worker has it."""
+    await bot.delete_webhook()
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=timeout, allowed_updates=allowed_updates)
+        except Exception as e:
+            logger.error(f"getUpdates failed, retrying in {retry_interval}s: {e}")
+            await asyncio.sleep(retry_interval)
+            continue
+        for update in updates:
+            if not await ingress.dispatch(update.to_dict()):
+                # Fetched again from this update on the next poll.
+                break
+            offset = update.update_id + 1
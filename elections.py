@@ -0,0 +1,78 @@
+"""Several elections hosted by one bot process.
+
+ELECTIONS names a JSON file listing the elections, for example:
+
+    [
+        {"id": "board", "ballot": "ballot.json", "roster": "roster.db", "spreadsheet_id": "1AbC..."},
+        {"id": "test", "ballot": "ballot_test.json", "roster": "roster_test.db", "storage": "sqlite"}
+    ]
+
+Each election has its own ballot, roster, spreadsheet and ballot store, and a
+namespace in the shared voted index. They share the Telegram application, one
+authorized Sheets session with its quotas and circuit breaker, and one
+background vote writer. Voters pick an election through a deep link,
+t.me/<bot>?start=<id>, which Telegram sends as "/start <id>".
+"""
+import json
+import re
+
+from tally import Tally
+
+# user_data key holding the id of the election a voter chose
+ELECTION_KEY = 'election'
+
+ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+OPTIONAL_KEYS = ('spreadsheet_id', 'storage', 'vote_db', 'journal', 'csv')
+STORAGE_KINDS = ('sheets', 'sqlite', 'csv')
+
+
+class Election:
+    """One hosted election and the components that belong to it alone."""
+
+    def __init__(self, id, ballot, registry, storage, voted, live=True):
+        self.id = id
+        self.ballot = ballot
+        self.registry = registry
+        self.storage = storage
+        self.voted = voted
+        self.tally = Tally(ballot, live=live)
+        self.seed_task = None
+        # (ReminderBroadcast, task) of the last /remind for this election
+        self.reminders = None
+
+    @property
+    def ready(self):
+        return self.registry.loaded and self.storage.ready
+
+
+def load_config(path, default_storage='sheets'):
+    """Read and check the ELECTIONS file; returns its entries as dicts.
+
+    `default_storage` is the storage of entries that do not name one.
+    """
+    with open(path, 'r') as f:
+        entries = json.load(f)
+    if not isinstance(entries, list) or not entries:
+        raise SystemExit(f"{path} must hold a non-empty list of elections.")
+    seen = set()
+    for entry in entries:
+        election_id = entry.get('id', '')
+        if not ID_PATTERN.match(election_id):
+            raise SystemExit(f"Election id {election_id!r} in {path} must be 1-64 letters, digits, '_' or '-'.")
+        if election_id in seen:
+            raise SystemExit(f"Election id {election_id!r} appears twice in {path}.")
+        seen.add(election_id)
+        missing = [key for key in ('ballot', 'roster') if key not in entry]
+        if missing:
+            raise SystemExit(f"Election {election_id!r} in {path} is missing {', '.join(missing)}.")
+        unknown = set(entry) - {'id', 'ballot', 'roster'} - set(OPTIONAL_KEYS)
+        if unknown:
+            raise SystemExit(f"Election {election_id!r} in {path} has unknown keys: {', '.join(sorted(unknown))}.")
+        storage = entry.get('storage', default_storage).lower()
+        if storage not in STORAGE_KINDS:
+            raise SystemExit(f"Election {election_id!r} in {path} has unknown storage {storage!r}; "
+                             f"use {', '.join(STORAGE_KINDS)}.")
+        if storage == 'sheets' and not entry.get('spreadsheet_id'):
+            raise SystemExit(f"Election {election_id!r} in {path} stores ballots in Google Sheets "
+                             f"but has no spreadsheet_id.")
+    return entries
@@ -0,0 +1,72 @@
+"""Post synthetic Telegram updates to the bot's webhook, standing in for Telegram.
+
+    python fake_telegram.py http://localhost:8080/telegram --secret $WEBHOOK_SECRET \
+        --chat 1001 /start voter@example.com "Jane Doe" CODE123 Yes Wizzywise Yes Yes Yes
+"""
+import argparse
+import asyncio
+import itertools
+import time
+
+from cluster import WebhookLink
+
+_update_ids = itertools.count(1)
+
+
+def message_update(chat_id, text, update_id=None):
+    """Build the JSON body Telegram would POST for a private text message."""
+    update_id = next(_update_ids) if update_id is None else update_id
+    user = {'id': chat_id, 'is_bot': False, 'first_name': f'Voter{chat_id}'}
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private', 'first_name': user['first_name']},
+        'from': user,
+        'text': text,
+    }
+    if text.startswith('/'):
+        command = text.split()[0]
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+    return {'update_id': update_id, 'message': message}
+
+
+def callback_update(chat_id, data, message_id=1, update_id=None):
+    """Build the JSON body Telegram would POST when a voter taps an inline button on message `message_id`."""
+    update_id = next(_update_ids) if update_id is None else update_id
+    user = {'id': chat_id, 'is_bot': False, 'first_name': f'Voter{chat_id}'}
+    message = {
+        'message_id': message_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private', 'first_name': user['first_name']},
+        'text': '',
+    }
+    query = {'id': str(update_id), 'from': user, 'chat_instance': str(chat_id), 'data': data, 'message': message}
+    return {'update_id': update_id, 'callback_query': query}
+
+
+class FakeTelegram(WebhookLink):
+    """Posts synthetic updates to the bot's webhook the way Telegram does."""
+
+    async def send_text(self, chat_id, text):
+        return await self.post(message_update(chat_id, text))
+
+
+async def _main(args):
+    fake = FakeTelegram(args.url, args.secret)
+    try:
+        for text in args.messages:
+            status = await fake.send_text(args.chat, text)
+            print(f"{status} <- {text!r}")
+            await asyncio.sleep(args.delay)
+    finally:
+        await fake.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('url', help='webhook URL, e.g. http://localhost:8080/telegram')
+    parser.add_argument('messages', nargs='+', help='texts to send in order')
+    parser.add_argument('--secret', help='value of WEBHOOK_SECRET')
+    parser.add_argument('--chat', type=int, default=1001, help='chat/user id to send as')
+    parser.add_argument('--delay', type=float, default=0.2, help='seconds between messages')
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_LINES = 100
+MAX_BODY = 1024 * 1024
+READ_TIMEOUT = 15
+
+REASONS = {
+    200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+    405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class Request:
+    __slots__ = ('method', 'path', 'query', 'headers', 'body')
+
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+
+class Response:
+    __slots__ = ('status', 'body', 'content_type')
+
+    def __init__(self, status=200, body=b'', content_type='text/plain; charset=utf-8'):
+        self.status = status
+        self.body = body if isinstance(body, bytes) else body.encode()
+        self.content_type = content_type
+
+
+class HTTPServer:
+    """Minimal asyncio HTTP/1.1 server that runs on the bot's own event loop.
+
+    Only registered routes are answered; nothing is ever served from disk.
+    """
+
+    def __init__(self, host='0.0.0.0', port=8080):
+        self.host = host
+        self.port = port
+        self.routes = {}
+        self._server = None
+
+    def route(self, method, path, handler):
+        """Register `async handler(request) -> Response` for an exact method and path."""
+        self.routes[(method, path)] = handler
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        logger.info(f"🌐 HTTP server listening on port {self.port}.")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise ValueError('malformed request line')
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise ValueError('too many headers')
+        length = int(headers.get('content-length', 0))
+        if length > MAX_BODY:
+            raise OverflowError
+        body = await reader.readexactly(length) if length else b''
+        path, _, query = target.partition('?')
+        return Request(method, path, query, headers, body)
+
+    async def _dispatch(self, request):
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self.routes):
+                return Response(405, 'method not allowed')
+            return Response(404, 'not found')
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error(f"HTTP handler for {request.method} {request.path} failed: {e}")
+            return Response(500, 'internal error')
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), READ_TIMEOUT)
+                except OverflowError:
+                    request, response = None, Response(413, 'payload too large')
+                except (ValueError, asyncio.IncompleteReadError):
+                    request, response = None, Response(400, 'bad request')
+                else:
+                    if request is None:
+                        break
+                    response = await self._dispatch(request)
+                keep_alive = request is not None and request.headers.get('connection', '').lower() != 'close'
+                head = (
+                    f"HTTP/1.1 {response.status} {REASONS.get(response.status, '')}\r\n"
+                    f"Content-Type: {response.content_type}\r\n"
+                    f"Content-Length: {len(response.body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                )
+                writer.write(head.encode('latin-1') + response.body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,60 @@
+import functools
+import time
+
+from telegram.ext import ConversationHandler
+from telegram.request import HTTPXRequest
+
+from metrics import HANDLER_LATENCY, EXTERNAL_CALL_LATENCY, STATE_TRANSITIONS, DROPOFFS
+from tracing import span, annotate
+
+STATE_KEY = 'state'
+
+
+def instrument_handler(state_name, state_names):
+    """Time a conversation handler and count the state transition it returns.
+
+    `state_names` maps conversation state constants to metric labels. The
+    voter's current state is kept in user_data so drop-offs can be attributed.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update, context):
+            annotate(state=state_name)
+            started = time.perf_counter()
+            try:
+                new_state = await handler(update, context)
+            finally:
+                HANDLER_LATENCY.observe(time.perf_counter() - started, state_name)
+            if new_state is None:
+                return new_state
+            to_state = 'end' if new_state == ConversationHandler.END else state_names.get(new_state, str(new_state))
+            if to_state != state_name:
+                STATE_TRANSITIONS.inc(state_name, to_state)
+            if context.user_data is not None:
+                context.user_data[STATE_KEY] = to_state
+            return new_state
+        return wrapper
+    return decorator
+
+
+class TimedRequest(HTTPXRequest):
+    """HTTPXRequest that records the latency of every Bot API call by method name, and traces it."""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        label = 'telegram.' + url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            with span(label):
+                return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            EXTERNAL_CALL_LATENCY.observe(time.perf_counter() - started, label)
+
+
+def record_dropoff(context):
+    """Count a conversation abandoned mid-flow, attributed to the state it was left in."""
+    if context.user_data is None:
+        return
+    state = context.user_data.get(STATE_KEY)
+    if state is not None and state != 'end':
+        DROPOFFS.inc(state)
+    context.user_data[STATE_KEY] = 'end'
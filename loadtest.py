@@ -0,0 +1,450 @@
+"""Load test the voting conversation with simulated voters, entirely offline.
+
+    python loadtest.py --voters 2000 --concurrency 500 --bot-latency 0.05 --sheets-latency 0.3
+
+Every voter sends /start, email, name, code and one answer per race as
+synthetic updates through the real Application, ConversationHandler,
+persistence and vote storage (--storage). Bot API calls are answered by a fake
+request after --bot-latency seconds and ballots land in an in-memory
+worksheet, so nothing touches the network. A step's latency runs from
+enqueueing the voter's update to the bot's reply to that chat.
+
+With --burst each voter sends all of their messages at once instead of
+waiting for replies, which stresses per-chat ordering under --workers. After
+the run every stored ballot is checked against what its voter sent, and the
+exit status is 1 if any ballot is missing, duplicated or corrupted.
+
+With --inline voters tap through the single-message inline ballot instead;
+the report's Bot API calls per voter compare the two modes. Inline mode makes
+more calls than keyboard mode: every tap is answered, and the ballot message
+is edited to show the answers after each pause in tapping, so simulated voters
+who tap quickly show the fewest edits a voter can cost.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from telegram import Update
+from telegram.ext import Application, SimpleUpdateProcessor
+from telegram.request import BaseRequest
+
+from ballot import Ballot, REVIEW, SUBMIT
+from elections import Election
+from fake_telegram import message_update, callback_update
+from send_scheduler import SendScheduler
+from update_processor import ChatSerializedProcessor
+from sessions import resident_memory_bytes
+from sheets_client import SheetsClient
+from sqlite_persistence import SQLitePersistence
+from vote_journal import BALLOT_ID_HEADER
+from voted_index import VotedIndex
+from reminders import ContactBook
+from voter_registry import VoterRegistry
+from roster_import import import_roster
+import main as bot
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Election Bot', 'username': 'election_loadtest_bot'}
+
+
+class FakeBotRequest(BaseRequest):
+    """Answers Bot API calls locally after a fixed latency and records what was sent."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+        self._replies = {}
+        self._queries = {}
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def replies(self, chat_id):
+        """Queue of the texts of messages sent to `chat_id`, in the order they were sent."""
+        if chat_id not in self._replies:
+            self._replies[chat_id] = asyncio.Queue()
+        return self._replies[chat_id]
+
+    def expect_answer(self, query):
+        """Route answerCallbackQuery toasts for the callback query `query` to its chat's replies."""
+        self._queries[query['id']] = query['message']['chat']['id']
+
+    @staticmethod
+    def _shows_answers(parameters):
+        """Whether an edit only refreshes an inline ballot with the answers so far, rather than replying to a tap."""
+        rows = (parameters.get('reply_markup') or {}).get('inline_keyboard', [])
+        return any(button.get('callback_data') == REVIEW for row in rows for button in row)
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        self.calls[api_method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        parameters = request_data.parameters if request_data is not None else {}
+        if api_method == 'getMe':
+            result = BOT_USER
+        elif api_method in ('sendMessage', 'editMessageText'):
+            chat_id = int(parameters['chat_id'])
+            result = {
+                'message_id': parameters.get('message_id') or next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': parameters.get('text', ''),
+            }
+            if api_method == 'sendMessage' or not self._shows_answers(parameters):
+                self.replies(chat_id).put_nowait(result['text'])
+        elif api_method == 'answerCallbackQuery':
+            chat_id = self._queries.pop(parameters['callback_query_id'])
+            # A toast is the reply to a tap; a bare answer only stops the spinner of a tap that edits the ballot.
+            if parameters.get('text'):
+                self.replies(chat_id).put_nowait(parameters['text'])
+            result = True
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+class MemoryWorksheet:
+    """The subset of a gspread worksheet the bot uses, kept in memory with a fixed per-call latency."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.rows = []
+        self.requests = 0
+
+    def _call(self):
+        # Called from worker threads, exactly like the blocking gspread calls it replaces.
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def row_values(self, row):
+        self._call()
+        return list(self.rows[row - 1]) if len(self.rows) >= row else []
+
+    def append_row(self, values):
+        self._call()
+        self.rows.append(list(values))
+
+    def append_rows(self, values):
+        self._call()
+        self.rows.extend(list(row) for row in values)
+
+    def update(self, values, range_name):
+        self._call()
+        self.rows[0] = list(values[0])
+
+    def col_values(self, column):
+        self._call()
+        return [row[column - 1] if len(row) >= column else '' for row in self.rows]
+
+    def get_all_values(self):
+        self._call()
+        return [list(row) for row in self.rows]
+
+
+class MemorySheets(SheetsClient):
+    """SheetsClient backed by a MemoryWorksheet instead of Google Sheets."""
+
+    def __init__(self, headers, latency=0.0, auth_latency=0.0):
+        super().__init__('loadtest', headers)
+        self.latency = latency
+        self.auth_latency = auth_latency
+
+    def connect(self):
+        with self._lock:
+            if self._sheet is None:
+                # Stands in for the service account's OAuth exchange.
+                time.sleep(self.auth_latency)
+                sheet = MemoryWorksheet(self.latency)
+                self.columns = self._verify_headers(sheet)
+                self._sheet = sheet
+            return self._sheet
+
+
+class LoopLagMonitor:
+    """Samples how late the event loop wakes a sleeping task, and peak resident memory."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.lags = []
+        self.peak_rss = resident_memory_bytes()
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(loop.time() - started - self.interval)
+            self.peak_rss = max(self.peak_rss, resident_memory_bytes())
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def write_roster(directory, voters):
+    """Import a synthetic roster of `voters` voters and return the store's path."""
+    path = os.path.join(directory, 'roster.db')
+    import_roster(((f"voter{i}@example.com", f"Voter {i}", f"CODE{i:06d}") for i in range(voters)), path)
+    return path
+
+
+def voter_script(i, ballot, inline=False):
+    """The (step, text, is button) inputs voter `i` sends, with random answers to each race."""
+    steps = [('start', '/start', False), ('email', f"voter{i}@example.com", False), ('name', f"Voter {i}", False),
+             ('code', f"CODE{i:06d}", False)]
+    races = list(ballot.races)
+    if inline:
+        # The inline ballot can be answered in any order.
+        random.shuffle(races)
+    for race in races:
+        choice = random.choice(race.choices)
+        steps.append((race.key, race.callback_data(choice) if inline else choice, inline))
+    if inline:
+        steps.extend([('review', REVIEW, True), ('submit', SUBMIT, True)])
+    return steps
+
+
+def expected_ballot(i, script, ballot):
+    """The {column: value} fields voter `i`'s stored ballot must have."""
+    expected = {'Email': f"voter{i}@example.com", 'Name': f"Voter {i}"}
+    for race, (_, text, button) in zip(ballot.races, script[4:]):
+        if button:
+            race = ballot.race_for(text)
+            expected[race.column] = race.parse_callback(text)
+        else:
+            expected[race.column] = text
+    return expected
+
+
+async def _reply(replies, step, started, latencies, timeout):
+    """Wait for the next reply to a voter and record its latency. Returns False if none came."""
+    try:
+        await asyncio.wait_for(replies.get(), timeout)
+    except asyncio.TimeoutError:
+        return False
+    latencies[step].append(time.perf_counter() - started)
+    return True
+
+
+async def vote(application, request, chat_id, script, latencies, timeout, burst=False):
+    """Send one voter's messages. Returns how many replies never arrived."""
+    replies = request.replies(chat_id)
+    pending = []
+    for n, (step, text, button) in enumerate(script):
+        pending.append((step, time.perf_counter()))
+        if button:
+            data = callback_update(chat_id, text)
+            request.expect_answer(data['callback_query'])
+        else:
+            data = message_update(chat_id, text)
+        await application.update_queue.put(Update.de_json(data, application.bot))
+        if not burst and not await _reply(replies, *pending.pop(), latencies, timeout):
+            return len(script) - n
+    for n, (step, started) in enumerate(pending):
+        if not await _reply(replies, step, started, latencies, timeout):
+            return len(pending) - n
+    return 0
+
+
+def check_ballots(records, expected):
+    """Compare stored ballots with what each voter sent, keyed by chat ID."""
+    by_chat = defaultdict(list)
+    for record in records:
+        by_chat[record.get('Chat ID')].append(record)
+    missing = duplicated = corrupted = 0
+    for chat_id, fields in expected.items():
+        stored = by_chat.get(str(chat_id), [])
+        if not stored:
+            missing += 1
+            continue
+        if len(stored) > 1:
+            duplicated += 1
+        if any(record.get(column) != value for record in stored for column, value in fields.items()):
+            corrupted += 1
+    return {'checked': len(expected), 'missing': missing, 'duplicated': duplicated, 'corrupted': corrupted}
+
+
+async def run_load(args):
+    ballot = Ballot.load(args.ballot, bot.FIRST_RACE_STATE)
+    with tempfile.TemporaryDirectory() as directory:
+        registry = VoterRegistry(write_roster(directory, args.voters))
+        registry.load()
+        sheets = MemorySheets(ballot.columns + [BALLOT_ID_HEADER], args.sheets_latency)
+        sheets.connect()
+        storage = bot.build_storage(
+            args.storage, sheets,
+            journal_path=os.path.join(directory, 'votes.journal'),
+            db_path=os.path.join(directory, 'votes.db'),
+            csv_path=os.path.join(directory, 'votes.csv'),
+        )
+        state_db = os.path.join(directory, 'bot_state.db')
+        voted = VotedIndex(state_db, capacity=args.voters)
+        request = FakeBotRequest(args.bot_latency)
+        builder = (
+            Application.builder()
+            .token('123456:loadtest')
+            .request(request)
+            .updater(None)
+            .persistence(SQLitePersistence(state_db))
+        )
+        if args.send_rate:
+            builder = builder.rate_limiter(SendScheduler(args.send_rate))
+        if args.workers:
+            processor = SimpleUpdateProcessor if args.unordered else ChatSerializedProcessor
+            builder = builder.concurrent_updates(processor(args.workers))
+        application = builder.build()
+        bot.setup_application(
+            application, [Election('', ballot, registry, storage, voted)], ContactBook(state_db), inline=args.inline
+        )
+
+        scripts = [voter_script(i, ballot, args.inline) for i in range(args.voters)]
+        expected = {10_000_000 + i: expected_ballot(i, script, ballot) for i, script in enumerate(scripts)}
+        latencies = defaultdict(list)
+        monitor = LoopLagMonitor()
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def voter(i):
+            async with semaphore:
+                return await vote(application, request, 10_000_000 + i, scripts[i], latencies, args.timeout, args.burst)
+
+        async with application:
+            await bot.post_init(application)
+            await application.start()
+            monitor.start()
+            started = time.perf_counter()
+            lost_replies = sum(await asyncio.gather(*(voter(i) for i in range(args.voters))))
+            elapsed = time.perf_counter() - started
+            await monitor.stop()
+            await application.stop()
+            integrity = check_ballots(await storage.stored_records(), expected)
+            await bot.post_shutdown(application)
+        sheet_rows = len(sheets.sheet.rows) - 1
+
+    updates = sum(len(values) for values in latencies.values())
+    return {
+        'voters': args.voters,
+        'storage': args.storage,
+        'concurrency': args.concurrency,
+        'bot_latency': args.bot_latency,
+        'sheets_latency': args.sheets_latency,
+        'send_rate': args.send_rate,
+        'workers': args.workers,
+        'unordered': args.unordered,
+        'burst': args.burst,
+        'inline': args.inline,
+        'elapsed_seconds': elapsed,
+        'updates_per_second': updates / elapsed,
+        'ballots_per_second': args.voters / elapsed,
+        'ballots_on_sheet': sheet_rows,
+        'sheet_requests': sheets.sheet.requests,
+        'bot_calls': dict(request.calls),
+        'lost_replies': lost_replies,
+        'integrity': integrity,
+        'steps': {
+            step: {
+                'count': len(values),
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'p99': percentile(values, 99),
+                'max': max(values),
+            }
+            for step, values in latencies.items()
+        },
+        'loop_lag': {
+            'p50': percentile(monitor.lags, 50),
+            'p99': percentile(monitor.lags, 99),
+            'max': max(monitor.lags, default=0.0),
+        },
+        'peak_rss_bytes': max(monitor.peak_rss, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024),
+    }
+
+
+def print_report(report):
+    print(f"{report['voters']} voters, {report['storage']} storage, concurrency {report['concurrency']}, "
+          f"bot latency {report['bot_latency'] * 1000:.0f} ms, sheets latency {report['sheets_latency'] * 1000:.0f} ms, "
+          f"send rate {report['send_rate'] or 'unlimited'}, "
+          f"{report['workers'] or 'sequential'} {'unordered ' if report['unordered'] else ''}workers"
+          f"{', burst' if report['burst'] else ''}{', inline ballot' if report['inline'] else ''}")
+    print(f"elapsed {report['elapsed_seconds']:.2f} s, {report['updates_per_second']:.1f} updates/s, "
+          f"{report['ballots_per_second']:.1f} ballots/s")
+    print(f"ballots on sheet {report['ballots_on_sheet']} in {report['sheet_requests']} sheet requests")
+    calls = report['bot_calls']
+    print(f"Bot API calls per voter {sum(calls.values()) / report['voters']:.1f}: " +
+          ', '.join(f"{method} {count}" for method, count in sorted(calls.items())))
+    print(f"{'step':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for step, stats in report['steps'].items():
+        print(f"{step:<16}{stats['count']:>8}" + ''.join(
+            f"{stats[key] * 1000:>10.1f}" for key in ('p50', 'p95', 'p99', 'max')))
+    lag = report['loop_lag']
+    print(f"event loop lag p50 {lag['p50'] * 1000:.1f} ms, p99 {lag['p99'] * 1000:.1f} ms, max {lag['max'] * 1000:.1f} ms")
+    print(f"peak RSS {report['peak_rss_bytes'] / 2 ** 20:.1f} MiB")
+    integrity = report['integrity']
+    print(f"ballots checked {integrity['checked']}: {integrity['missing']} missing, {integrity['duplicated']} duplicated, "
+          f"{integrity['corrupted']} corrupted; {report['lost_replies']} replies never arrived")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent voters against the bot without any network.")
+    parser.add_argument('--voters', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=200, help="voters mid-conversation at once")
+    parser.add_argument('--bot-latency', type=float, default=0.05, help="seconds per Bot API call")
+    parser.add_argument('--sheets-latency', type=float, default=0.3, help="seconds per Sheets request")
+    parser.add_argument('--send-rate', type=float, default=30, help="global sends per second, 0 for no scheduler")
+    parser.add_argument('--workers', type=int, default=64, help="updates handled at once, 0 for one at a time")
+    parser.add_argument('--unordered', action='store_true', help="do not serialize updates per chat (shows why it is needed)")
+    parser.add_argument('--burst', action='store_true', help="each voter sends every message without waiting for replies")
+    parser.add_argument('--inline', action='store_true', help="vote through the inline-keyboard ballot")
+    parser.add_argument('--ballot', default='ballot.json')
+    parser.add_argument('--storage', choices=('sheets', 'sqlite', 'csv'), default='sheets')
+    parser.add_argument('--timeout', type=float, default=60, help="seconds to wait for any one reply")
+    parser.add_argument('--seed', type=int, default=0, help="random seed for the voters' answers")
+    parser.add_argument('--json', metavar='PATH', help="also write the report as JSON, for comparing runs")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    random.seed(args.seed)
+    report = asyncio.run(run_load(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    integrity = report['integrity']
+    if integrity['missing'] or integrity['duplicated'] or integrity['corrupted'] or report['lost_replies']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,240 +1,968 @@
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
-from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, filters, ConversationHandler
+from telegram import Bot, Update, ReplyKeyboardRemove
+from telegram.error import TelegramError
+from telegram.ext import (
+    Application, CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler, ContextTypes, filters, ConversationHandler
+)
 from datetime import datetime
-import json
 import os
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 import time
+import hmac
+import json
+import asyncio
+import contextlib
+import functools
+import warnings
+import signal
 import logging
-import threading
-import http.server
-import socketserver
 from dotenv import load_dotenv
+from http_server import HTTPServer, Response
+from metrics import REGISTRY, INVALID_INPUTS
+from instrumentation import instrument_handler, record_dropoff, TimedRequest
+from ballot import Ballot, DEFAULT_MESSAGES, CHOICE_PATTERN, MAX_INLINE_BUTTONS, REVIEW, SUBMIT, RESTART
+from sqlite_persistence import SQLitePersistence
+from send_scheduler import SendScheduler, INFO
+from update_processor import ChatSerializedProcessor
+from sessions import SessionReaper, resident_memory_bytes
+from tally import Tally
+from voted_index import VotedIndex
+from reminders import ContactBook, ReminderBroadcast
+from tracing import TRACER, span
+from profiling import Profiler
+from voter_registry import VoterRegistry, LEGACY_ROSTER_FILES
+from roster_import import import_json_if_changed
+from sheets_client import SheetsClient, SheetsSession
+from vote_writer import VoteWriter
+from vote_journal import VoteJournal, BALLOT_ID_HEADER
+from vote_storage import SheetsStorage, SQLiteStorage, CSVStorage
+from cluster import Ingress, poll_updates
+from elections import Election, ELECTION_KEY, load_config
 
 # Load environment variables
 load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 SPREADSHEET_ID = os.getenv('SPREADSHEET_ID')
+# Where ballots are committed: 'sheets' (journal + Google Sheets), 'sqlite' (VOTE_DB, mirrored
+# to the sheet when SPREADSHEET_ID is set) or 'csv' (VOTE_CSV, no sheet)
+VOTE_STORAGE = os.getenv('VOTE_STORAGE', 'sheets').lower()
+VOTE_JOURNAL = os.getenv('VOTE_JOURNAL', 'votes.journal')
+VOTE_DB = os.getenv('VOTE_DB', 'votes.db')
+VOTE_CSV = os.getenv('VOTE_CSV', 'votes.csv')
+BALLOT_FILE = os.getenv('BALLOT_FILE', 'ballot.json')
+STATE_DB = os.getenv('STATE_DB', 'bot_state.db')
+# JSON file listing several elections to host at once (see elections.py); when set, BALLOT_FILE,
+# ROSTER_DB and SPREADSHEET_ID are ignored and each election's files default to votes-<id>.db etc.
+ELECTIONS = os.getenv('ELECTIONS', '')
+# 'keyboard' (default): one message per race, answered by typing or the reply keyboard;
+# 'inline': one ballot message edited in place through inline buttons, then a submit step.
+# Inline mode costs more Bot API calls per voter: every tap must be answered, and the ballot
+# message is edited to show the answers at most once per BALLOT_EDIT_DELAY seconds of tapping
+BALLOT_MODE = os.getenv('BALLOT_MODE', 'keyboard').lower()
+BALLOT_EDIT_DELAY = float(os.getenv('BALLOT_EDIT_DELAY', 2))
+# Voter roster built by roster_import.py; imported from the legacy JSON files when missing
+ROSTER_DB = os.getenv('ROSTER_DB', 'roster.db')
+# Idle voter sessions are dropped after SESSION_TTL seconds, oldest first beyond MAX_SESSIONS
+SESSION_TTL = int(os.getenv('SESSION_TTL', 1800))
+MAX_SESSIONS = int(os.getenv('MAX_SESSIONS', 20000))
+# Keep only a Bloom filter of who has voted in memory and confirm hits in STATE_DB
+VOTED_INDEX_COMPACT = os.getenv('VOTED_INDEX_COMPACT', '').lower() in ('1', 'true', 'yes')
+# Telegram user IDs allowed to run admin commands such as /results, comma separated
+ADMIN_IDS = frozenset(int(i) for i in os.getenv('ADMIN_IDS', '').split(',') if i.strip())
+# Bearer token for GET /results; the endpoint is disabled when unset
+RESULTS_TOKEN = os.getenv('RESULTS_TOKEN', '')
+# Reminder messages in flight at once during a /remind broadcast
+REMINDER_CONCURRENCY = int(os.getenv('REMINDER_CONCURRENCY', 8))
+# Seconds between progress reports to the admin running a broadcast
+REMINDER_PROGRESS_INTERVAL = float(os.getenv('REMINDER_PROGRESS_INTERVAL', 30))
+# Updates slower than TRACE_SLOW_SECONDS are logged with a breakdown of their calls; with TRACE_FILE
+# set, those and a TRACE_SAMPLE_RATE fraction of all updates are appended to it as JSON lines
+TRACE_FILE = os.getenv('TRACE_FILE', '')
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.01))
+TRACE_SLOW_SECONDS = float(os.getenv('TRACE_SLOW_SECONDS', 2))
+# /profile [seconds] and SIGUSR1 write profile reports here; SIGUSR1 profiles for PROFILE_SECONDS
+PROFILE_DIR = os.getenv('PROFILE_DIR', '.')
+PROFILE_SECONDS = int(os.getenv('PROFILE_SECONDS', 30))
+# Updates handled at once; updates from the same chat are still handled one at a time, in order
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', 64))
+# Outgoing messages per second across all chats, kept under Telegram's ~30/s flood limit
+SEND_RATE = float(os.getenv('SEND_RATE', 30))
+PORT = int(os.getenv('PORT', 8080))
+# 'polling' (default) or 'webhook'; webhook needs WEBHOOK_URL, the public base URL of this app
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+# WORKERS > 1 runs this process as an ingress sharding updates by chat to that many worker
+# processes on ports PORT+1..PORT+WORKERS; needs VOTE_STORAGE=sqlite
+WORKERS = int(os.getenv('WORKERS', 1))
+# Set by the ingress for each worker process it starts
+WORKER_INDEX = int(os.getenv('WORKER_INDEX')) if os.getenv('WORKER_INDEX') else None
+WORKER_COUNT = int(os.getenv('WORKER_COUNT', 1))
 
 # Logging setup
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Conversation states
+# Conversation states; ballot races are numbered from FIRST_RACE_STATE by the ballot spec
 WAITING_FOR_EMAIL = 1
 WAITING_FOR_VERIFICATION = 2
-VOTING_PRESIDENT = 3
-VOTING_VICE_PRESIDENT = 4
-VOTING_ASSISTANT_SECRETARY = 5
-VOTING_PRO = 6
-VOTING_DO_SOCIALS = 7
-VOTING_DO_SPORTS = 8
+FIRST_RACE_STATE = 3
 
-authenticated_users = set()
-user_votes = {}
+STATE_NAMES = {WAITING_FOR_EMAIL: 'email', WAITING_FOR_VERIFICATION: 'verification'}
 
-def setup_google_sheets():
-    try:
-        scope = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-        creds = ServiceAccountCredentials.from_json_keyfile_name('credentials.json', scope)
-        client = gspread.authorize(creds)
-        sheet = client.open_by_key(SPREADSHEET_ID).sheet1
-        expected_headers = [
-            "Chat ID", "Email", "Name", "TtED_President", "Vice_President",
-            "Rachel_Assistant_Secretary", "Lionel_PRO", "Marvellous_DO_Socials",
-            "AbleGod_DO_Sports", "Timestamp"
-        ]
-        current_headers = sheet.row_values(1)
-        if not current_headers or current_headers != expected_headers:
-            sheet.clear()
-            sheet.append_row(expected_headers)
-        return sheet
-    except Exception as e:
-        logger.error(f"Failed to setup Google Sheets: {e}")
-        return None
+def timed(state_name):
+    return instrument_handler(state_name, STATE_NAMES)
 
-def load_voter_data():
-    try:
-        with open('voter_emails.json', 'r') as f:
-            emails = json.load(f)
-        with open('voter_names.json', 'r') as f:
-            names = json.load(f)
-        with open('verification_codes.json', 'r') as f:
-            codes = json.load(f)
-        return emails, names, codes
-    except Exception as e:
-        logger.error(f"Failed to load voter data: {e}")
-        return [], [], []
+def verify_voter(registry, email, name, code):
+    return registry.verify(email, name, code)
+
+def election_for(context: ContextTypes.DEFAULT_TYPE):
+    """The election this chat is voting in: the only one hosted, or the one chosen with /start <id>."""
+    elections = context.bot_data['elections']
+    if len(elections) == 1:
+        return next(iter(elections.values()))
+    return elections.get(context.user_data.get(ELECTION_KEY))
 
-def verify_voter(email, name, code):
-    emails, names, codes = load_voter_data()
-    if email in emails:
-        return True
-    return False
+def messages_for(context: ContextTypes.DEFAULT_TYPE):
+    election = election_for(context)
+    return election.ballot.messages if election is not None else DEFAULT_MESSAGES
 
-def store_vote(sheet, chat_id, email, name, votes):
+def election_choices(elections):
+    lines = [f"/start {election_id} — {election.ballot.name or election_id}" for election_id, election in elections.items()]
+    return "Which election are you voting in? Send one of:\n" + '\n'.join(lines)
+
+async def store_vote(election, chat_id, email, name, votes):
+    """Store a ballot; returns True, False on failure, or None if this voter has already voted."""
+    voted = election.voted
+    # Claimed before the await so two sessions for one email cannot both be stored.
     try:
-        timestamp = datetime.now().isoformat()
-        row_data = [
-            str(chat_id), email, name,
-            votes.get('president', ''), votes.get('vice_president', ''),
-            votes.get('assistant_secretary', ''), votes.get('pro', ''),
-            votes.get('do_socials', ''), votes.get('do_sports', ''), timestamp
-        ]
-        sheet.append_row(row_data)
-        return True
+        claimed = await voted.claim(email, chat_id)
+    except Exception as e:
+        # For example the shared index stayed locked by other workers past the busy timeout.
+        logger.error(f"Failed to claim the vote for {chat_id}: {e}")
+        return False
+    if not claimed:
+        return None
+    timestamp = datetime.now().isoformat()
+    record = {"Chat ID": str(chat_id), "Email": email, "Name": name, "Timestamp": timestamp}
+    record.update(election.ballot.record(votes))
+    try:
+        with span('storage.store'):
+            key = await election.storage.store(chat_id, record)
     except Exception as e:
         logger.error(f"Failed to store vote: {e}")
+        await voted.release(email, chat_id)
         return False
+    record[BALLOT_ID_HEADER] = key
+    election.tally.add(record)
+    try:
+        await voted.confirm(email)
+    except Exception as e:
+        # The ballot is stored; the claim is settled against storage on the next start.
+        logger.error(f"Failed to settle the claim for a stored ballot: {e}")
+    return True
 
+@timed('start')
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    record_dropoff(context)
+    context.bot_data['sessions'].pop_evicted(update.effective_user.id)
+    elections = context.bot_data['elections']
+    if context.args and context.args[0] in elections:
+        context.user_data[ELECTION_KEY] = context.args[0]
+    election = election_for(context)
+    if election is None:
+        await update.message.reply_text(election_choices(elections))
+        return ConversationHandler.END
+    messages = election.ballot.messages
     user_id = update.effective_user.id
-    if user_id in authenticated_users:
-        await update.message.reply_text("You have already voted in this session. Thank you!")
+    if election.voted.has_voted(chat_id=user_id):
+        await update.message.reply_text(messages['already_voted'])
         return ConversationHandler.END
-    await update.message.reply_text("Welcome to the NADEESTU Voting Bot. Please enter your registered email:")
+    await context.bot_data['contacts'].record(user_id, election=election.id)
+    context.user_data.pop('verification_step', None)
+    await update.message.reply_text(messages['welcome'])
     return WAITING_FOR_EMAIL
 
+@timed('email')
 async def handle_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    messages = messages_for(context)
     email = update.message.text.strip().lower()
     if '@' not in email or '.' not in email:
-        await update.message.reply_text("❌ Invalid email. Try again:")
+        INVALID_INPUTS.inc('email')
+        await update.message.reply_text(messages['invalid_email'])
         return WAITING_FOR_EMAIL
     context.user_data['email'] = email
-    await update.message.reply_text("Enter your full name:")
+    await update.message.reply_text(messages['ask_name'])
     return WAITING_FOR_VERIFICATION
 
+@timed('verification')
 async def handle_verification(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    election = election_for(context)
+    if election is None or 'email' not in context.user_data:
+        return await session_expired(update, context)
+    ballot = election.ballot
     if 'verification_step' not in context.user_data:
         context.user_data['name'] = update.message.text.strip()
         context.user_data['verification_step'] = 'code'
-        await update.message.reply_text("Enter your verification code:")
+        await update.message.reply_text(ballot.messages['ask_code'])
         return WAITING_FOR_VERIFICATION
     else:
         code = update.message.text.strip()
         email = context.user_data['email']
         name = context.user_data['name']
-        if verify_voter(email, name, code):
-            user_id = update.effective_user.id
-            authenticated_users.add(user_id)
-            user_votes[user_id] = {}
-            context.user_data['sheet'] = setup_google_sheets()
-            if not context.user_data['sheet']:
-                await update.message.reply_text("❌ Could not connect to Google Sheets.")
+        if verify_voter(election.registry, email, name, code):
+            if election.voted.has_voted(email=email):
+                context.user_data.clear()
+                await update.message.reply_text(ballot.messages['already_voted'])
                 return ConversationHandler.END
-            await update.message.reply_text("TtED for President: Vote Yes or No")
-            return VOTING_PRESIDENT
+            await context.bot_data['contacts'].record(update.effective_user.id, email, election.id)
+            if context.bot_data['inline']:
+                context.user_data['votes'] = ballot.blank
+                await update.message.reply_text(ballot.inline_text, reply_markup=ballot.inline_keyboard)
+                return ballot.inline_state
+            context.user_data['votes'] = ''
+            first = ballot.races[0]
+            await update.message.reply_text(first.prompt, reply_markup=first.keyboard)
+            return first.state
         else:
-            await update.message.reply_text("❌ Invalid verification. Try code again:")
+            INVALID_INPUTS.inc('verification')
+            await update.message.reply_text(ballot.messages['invalid_code'])
             return WAITING_FOR_VERIFICATION
 
-async def handle_president_vote(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    vote = update.message.text.strip().lower()
-    if vote not in ['yes', 'no']:
-        await update.message.reply_text("Vote Yes or No only:")
-        return VOTING_PRESIDENT
-    user_id = update.effective_user.id
-    user_votes[user_id]['president'] = vote.capitalize()
-    keyboard = [[KeyboardButton("Wizzywise"), KeyboardButton("BennieBliss")]]
-    await update.message.reply_text("Vice President: Choose one:", reply_markup=ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True))
-    return VOTING_VICE_PRESIDENT
-
-async def handle_vice_president_vote(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    vote = update.message.text.strip()
-    if vote not in ['Wizzywise', 'BennieBliss']:
-        await update.message.reply_text("❌ Invalid choice. Choose Wizzywise or BennieBliss:")
-        return VOTING_VICE_PRESIDENT
-    user_id = update.effective_user.id
-    user_votes[user_id]['vice_president'] = vote
-    await update.message.reply_text("Rachel for Assistant General Secretary: Vote Yes or No", reply_markup=ReplyKeyboardRemove())
-    return VOTING_ASSISTANT_SECRETARY
-
-async def handle_assistant_secretary_vote(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    vote = update.message.text.strip().lower()
-    if vote not in ['yes', 'no']:
-        await update.message.reply_text("Vote Yes or No only:")
-        return VOTING_ASSISTANT_SECRETARY
-    user_id = update.effective_user.id
-    user_votes[user_id]['assistant_secretary'] = vote.capitalize()
-    await update.message.reply_text("Lionel for Public Relations Officer: Vote Yes or No")
-    return VOTING_PRO
-
-async def handle_pro_vote(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    vote = update.message.text.strip().lower()
-    if vote not in ['yes', 'no']:
-        await update.message.reply_text("Vote Yes or No only:")
-        return VOTING_PRO
-    user_id = update.effective_user.id
-    user_votes[user_id]['pro'] = vote.capitalize()
-    await update.message.reply_text("AbleGod for Director of Sports: Vote Yes or No")
-    return VOTING_DO_SPORTS
-
-# async def handle_do_socials_vote(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # vote = update.message.text.strip().lower()
-    # if vote not in ['yes', 'no']:
-        # await update.message.reply_text("Vote Yes or No only:")
-        # return VOTING_DO_SOCIALS
-    # user_id = update.effective_user.id
-    # user_votes[user_id]['do_socials'] = vote.capitalize()
-    # await update.message.reply_text("AbleGod for Director of Sports: Vote Yes or No")
-    # return VOTING_DO_SPORTS
-
-async def handle_do_sports_vote(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    vote = update.message.text.strip().lower()
-    if vote not in ['yes', 'no']:
-        await update.message.reply_text("Vote Yes or No only:")
-        return VOTING_DO_SPORTS
+def make_race_handler(index, state_name):
+    """Build the handler for the race at `index`, which is looked up on the voter's own ballot."""
+
+    @timed(state_name)
+    async def handle_vote(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        election = election_for(context)
+        if election is None or index >= len(election.ballot.races):
+            return await session_expired(update, context)
+        race = election.ballot.races[index]
+        vote = race.parse(update.message.text)
+        if vote is None:
+            INVALID_INPUTS.inc(race.key)
+            await update.message.reply_text(race.invalid_prompt, reply_markup=race.keyboard)
+            return race.state
+        votes = context.user_data.get('votes')
+        if votes is None:
+            return await session_expired(update, context)
+        context.user_data['votes'] = race.encode(votes, vote)
+        next_race = election.ballot.next_race(race)
+        if next_race is not None:
+            await update.message.reply_text(next_race.next_prompt, reply_markup=next_race.keyboard)
+            return next_race.state
+        return await complete_ballot(update, context)
+
+    return handle_vote
+
+def inline_votes(context):
+    """The voter's election and inline ballot so far, or (None, None) once the session is gone."""
+    election = election_for(context)
+    votes = context.user_data.get('votes')
+    if election is None or votes is None or len(votes) != len(election.ballot.races):
+        return None, None
+    return election, votes
+
+async def show_answers(context, message, delay):
+    """Edit the inline ballot `message` to show the voter's answers once `delay` seconds of tapping pass."""
+    await asyncio.sleep(delay)
+    election, votes = inline_votes(context)
+    if election is None:
+        return
+    text, keyboard = election.ballot.inline_view(votes)
+    try:
+        await message.edit_text(text, reply_markup=keyboard)
+    except TelegramError as e:
+        logger.warning(f"Failed to show answers on the ballot in chat {message.chat_id}: {e}")
+    finally:
+        context.bot_data['ballot_edits'].pop(message.chat_id, None)
+
+async def cancel_answers_edit(context, chat_id):
+    """Drop a pending show_answers edit, so it cannot land after the message moves on to the review."""
+    task = context.bot_data['ballot_edits'].pop(chat_id, None)
+    if task is not None:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+# A tap is confirmed at once with a toast. The ballot message is edited to show the answers after the
+# voter has stopped tapping for BALLOT_EDIT_DELAY, so a run of quick taps costs one paced edit.
+@timed('ballot')
+async def handle_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    election, votes = inline_votes(context)
+    if election is None:
+        await query.answer()
+        return await session_expired(update, context)
+    ballot = election.ballot
+    race = ballot.race_for(query.data)
+    choice = race.parse_callback(query.data) if race is not None else None
+    if choice is None:
+        INVALID_INPUTS.inc(race.key if race is not None else 'button')
+        await query.answer()
+        return ballot.inline_state
+    context.user_data['votes'] = race.choose(votes, choice)
+    edits = context.bot_data['ballot_edits']
+    if query.message is not None and query.message.chat_id not in edits:
+        edits[query.message.chat_id] = asyncio.create_task(show_answers(context, query.message, BALLOT_EDIT_DELAY))
+    await query.answer(ballot.messages['chosen'].format(label=race.label, vote=choice))
+    return ballot.inline_state
+
+@timed('ballot')
+async def handle_review_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    election, votes = inline_votes(context)
+    if election is None:
+        await query.answer()
+        return await session_expired(update, context)
+    ballot = election.ballot
+    missing = ballot.unanswered(votes)
+    if missing:
+        numbers = ', '.join(str(race.number) for race in missing)
+        await query.answer(ballot.messages['unanswered'].format(numbers=numbers), show_alert=True)
+        return ballot.inline_state
+    await cancel_answers_edit(context, update.effective_chat.id)
+    await asyncio.gather(
+        query.answer(), query.edit_message_text(ballot.review(ballot.decode(votes)), reply_markup=ballot.review_keyboard)
+    )
+    return ballot.review_state
+
+@timed('review')
+async def handle_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    election, votes = inline_votes(context)
+    if election is None or election.ballot.unanswered(votes):
+        await query.answer()
+        return await session_expired(update, context)
+    ballot = election.ballot
+    if query.data == RESTART:
+        context.user_data['votes'] = ballot.blank
+        await asyncio.gather(query.answer(), query.edit_message_text(ballot.inline_text, reply_markup=ballot.inline_keyboard))
+        return ballot.inline_state
+    await query.answer()
+    return await complete_ballot(update, context)
+
+async def use_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    INVALID_INPUTS.inc('typed')
+    await update.message.reply_text(messages_for(context)['use_buttons'])
+
+async def unhandled(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Messages and taps no conversation state took: tell a voter whose session was evicted to /start again.
+
+    Otherwise a tap on a button from an old or finished ballot only has its spinner stopped.
+    """
+    if update.callback_query is not None:
+        await update.callback_query.answer()
+    if update.effective_user and context.bot_data['sessions'].pop_evicted(update.effective_user.id):
+        await session_expired(update, context)
+
+async def complete_ballot(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    election = election_for(context)
+    ballot = election.ballot
     user_id = update.effective_user.id
-    user_votes[user_id]['do_sports'] = vote.capitalize()
-    sheet = context.user_data.get('sheet')
-    if sheet:
-        store_vote(sheet, update.effective_user.id, context.user_data['email'], context.user_data['name'], user_votes[user_id])
-        await update.message.reply_text("✅ Voting complete. Thank you for participating!")
+    votes = ballot.decode(context.user_data['votes'])
+    stored = await store_vote(election, user_id, context.user_data['email'], context.user_data['name'], votes)
+    if stored:
+        # The ballot is safe locally; while Sheets is unavailable, say it is queued rather than recorded.
+        message = 'queued' if election.storage.degraded else 'complete'
+        text = ballot.messages[message].format(summary=ballot.summary(votes))
+    elif stored is None:
+        text = ballot.messages['already_voted']
+    else:
+        text = ballot.messages['store_failed']
+    # Nothing in the session is needed once the ballot is stored.
+    context.user_data.clear()
+    if update.callback_query is not None:
+        # The ballot message itself becomes the receipt.
+        await update.callback_query.edit_message_text(text)
+    else:
+        await update.message.reply_text(text, reply_markup=ReplyKeyboardRemove())
+    return ConversationHandler.END
+
+async def session_expired(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.bot_data['sessions'].pop_evicted(update.effective_user.id)
+    text = messages_for(context)['expired']
+    if update.callback_query is not None:
+        await update.callback_query.edit_message_text(text)
     else:
-        await update.message.reply_text("❌ Could not save vote. Contact admin.")
+        await update.message.reply_text(text, reply_markup=ReplyKeyboardRemove())
     return ConversationHandler.END
 
+async def track_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user:
+        context.bot_data['sessions'].touch(update.effective_user.id)
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("🚫 Voting cancelled.", reply_markup=ReplyKeyboardRemove())
+    record_dropoff(context)
+    context.user_data.pop('votes', None)
+    await update.message.reply_text(messages_for(context)['cancelled'], reply_markup=ReplyKeyboardRemove())
     return ConversationHandler.END
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("🗳️ Use /start to begin voting or /cancel to stop.")
+    election = election_for(context)
+    text = election.ballot.help if election is not None else election_choices(context.bot_data['elections'])
+    await context.bot.send_message(update.effective_chat.id, text, rate_limit_args=INFO)
 
-def run_dummy_server():
-    PORT = int(os.environ.get("PORT", 10000))
-    Handler = http.server.SimpleHTTPRequestHandler
-    with socketserver.TCPServer(("", PORT), Handler) as httpd:
-        logger.info(f"🌐 Dummy HTTP server running on port {PORT}.")
-        httpd.serve_forever()
+def named_election(context: ContextTypes.DEFAULT_TYPE):
+    """For admin commands: the election named by the first argument and the remaining arguments.
 
-def main():
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-
-    conv_handler = ConversationHandler(
-        entry_points=[CommandHandler('start', start)],
-        states={
-            WAITING_FOR_EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_email)],
-            WAITING_FOR_VERIFICATION: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_verification)],
-            VOTING_PRESIDENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_president_vote)],
-            VOTING_VICE_PRESIDENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_vice_president_vote)],
-            VOTING_ASSISTANT_SECRETARY: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_assistant_secretary_vote)],
-            VOTING_PRO: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_pro_vote)],
-            # VOTING_DO_SOCIALS: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_do_socials_vote)],
-            VOTING_DO_SPORTS: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_do_sports_vote)],
-        },
-        fallbacks=[CommandHandler('cancel', cancel)],
-        allow_reentry=True
+    With a single election no name is needed. Returns (None, args) if the name is missing or unknown.
+    """
+    elections = context.bot_data['elections']
+    if len(elections) == 1:
+        return next(iter(elections.values())), context.args
+    if context.args and context.args[0] in elections:
+        return elections[context.args[0]], context.args[1:]
+    return None, context.args
+
+async def results_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    elections = context.bot_data['elections']
+    election, _ = named_election(context)
+    if election is not None:
+        text = election.tally.format()
+    elif context.args:
+        text = f"Unknown election. Elections: {', '.join(elections)}"
+    else:
+        text = '\n\n'.join(f"{election_id}\n{election.tally.format()}" for election_id, election in elections.items())
+    await context.bot.send_message(update.effective_chat.id, text, rate_limit_args=INFO)
+
+async def run_reminders(context: ContextTypes.DEFAULT_TYPE, broadcast: ReminderBroadcast, admin_chat_id):
+    async def report():
+        while True:
+            await asyncio.sleep(REMINDER_PROGRESS_INTERVAL)
+            await context.bot.send_message(admin_chat_id, broadcast.progress(), rate_limit_args=INFO)
+
+    reporter = asyncio.create_task(report())
+    try:
+        finished = await broadcast.run()
+    except Exception as e:
+        logger.error(f"Reminder broadcast {broadcast.id} failed: {e}")
+        finished = False
+    finally:
+        reporter.cancel()
+    note = "Finished." if finished else "Some reminders failed; send /remind to retry them."
+    await context.bot.send_message(admin_chat_id, f"{broadcast.progress()}\n{note}", rate_limit_args=INFO)
+
+async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Remind registered voters who have not voted, resuming an unfinished broadcast if there is one."""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    election, args = named_election(context)
+    if election is None:
+        await update.message.reply_text(
+            f"Usage: /remind <election> [text]. Elections: {', '.join(context.bot_data['elections'])}")
+        return
+    running = election.reminders
+    if running is not None and not running[1].done():
+        await update.message.reply_text(running[0].progress())
+        return
+    contacts = context.bot_data['contacts']
+    text = ' '.join(args) or election.ballot.messages['reminder']
+    broadcast_id, text, resumed = await asyncio.to_thread(contacts.open_broadcast, text, election.id)
+    broadcast = ReminderBroadcast(
+        contacts, election.registry, election.voted, context.bot, broadcast_id, text, REMINDER_CONCURRENCY,
+        election=election.id
     )
+    task = asyncio.create_task(run_reminders(context, broadcast, update.effective_chat.id))
+    election.reminders = (broadcast, task)
+    verb = "Resuming" if resumed else "Starting"
+    await update.message.reply_text(f"{verb} reminder broadcast {broadcast_id}:\n{text}")
+
+async def remind_stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    election, _ = named_election(context)
+    if election is None:
+        await update.message.reply_text(
+            f"Usage: /remind_stop <election>. Elections: {', '.join(context.bot_data['elections'])}")
+        return
+    running = election.reminders
+    if running is None or running[1].done():
+        await update.message.reply_text("No reminder broadcast is running.")
+        return
+    running[1].cancel()
+    await update.message.reply_text(f"Stopped. {running[0].progress()}\nSend /remind to resume.")
+
+async def run_profile(application: Application, seconds, admin_chat_id=None):
+    try:
+        path = await application.bot_data['profiler'].run(seconds)
+        text = f"Profile written to {path}"
+    except Exception as e:
+        logger.error(f"Profiling failed: {e}")
+        text = f"Profiling failed: {e}"
+    if admin_chat_id is not None:
+        await application.bot.send_message(admin_chat_id, text, rate_limit_args=INFO)
 
-    application.add_handler(conv_handler)
+def start_profile(application: Application, seconds, admin_chat_id=None):
+    # Runs in the background so the admin's later updates are not held up behind the profile.
+    application.bot_data['profile_task'] = asyncio.get_running_loop().create_task(
+        run_profile(application, seconds, admin_chat_id))
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Profile the bot for the given number of seconds, up to 10 minutes, and reply with the report's path."""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    if context.bot_data['profiler'].running:
+        await update.message.reply_text("A profile is already running.")
+        return
+    try:
+        seconds = min(int(context.args[0]), 600) if context.args else PROFILE_SECONDS
+    except ValueError:
+        await update.message.reply_text("Usage: /profile [seconds]")
+        return
+    start_profile(context.application, seconds, update.effective_chat.id)
+    await update.message.reply_text(f"Profiling for {seconds}s.")
+
+def state_names(ballots):
+    """Name each ballot state after its race, or by position where the hosted ballots disagree."""
+    names = {}
+    for ballot in ballots:
+        for state, name in ballot.state_names.items():
+            names[state] = name if names.get(state, name) == name else f"race{state - FIRST_RACE_STATE + 1}"
+    return names
+
+def build_conversation(ballots, inline=False):
+    """One conversation for every hosted ballot; race states are shared by position on the ballot."""
+    text = filters.TEXT & ~filters.COMMAND
+    states = {
+        WAITING_FOR_EMAIL: [MessageHandler(text, handle_email)],
+        WAITING_FOR_VERIFICATION: [MessageHandler(text, handle_verification)],
+    }
+    names = state_names(ballots)
+    if inline:
+        states[ballots[0].inline_state] = [
+            CallbackQueryHandler(handle_choice, pattern=CHOICE_PATTERN),
+            CallbackQueryHandler(handle_review_request, pattern=f'^{REVIEW}$'),
+            MessageHandler(text, use_buttons),
+        ]
+        states[ballots[0].review_state] = [
+            CallbackQueryHandler(handle_review, pattern=f'^[{SUBMIT}{RESTART}]$'),
+            MessageHandler(text, use_buttons),
+        ]
+    else:
+        for index in range(max(len(ballot.races) for ballot in ballots)):
+            race = next(ballot.races[index] for ballot in ballots if index < len(ballot.races))
+            states[race.state] = [MessageHandler(text, make_race_handler(index, names[race.state]))]
+    # PTB warns that CallbackQueryHandlers are tracked per chat unless per_message=True. That is the
+    # intent here: a conversation starts with typed replies, and per_message would accept only buttons.
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message=".*per_message=False.*")
+        return ConversationHandler(
+            entry_points=[CommandHandler('start', start)],
+            states=states,
+            fallbacks=[CommandHandler('cancel', cancel)],
+            allow_reentry=True,
+            name='voting',
+            persistent=True
+        )
+
+async def healthz(request):
+    return Response(200, 'ok')
+
+async def readyz(request, application):
+    if all(election.ready for election in application.bot_data['elections'].values()):
+        return Response(200, 'ready')
+    return Response(503, 'not ready')
+
+async def results_json(request, tallies):
+    """A single election's results, or with several an object of them keyed by election id."""
+    supplied = request.headers.get('authorization', '').encode()
+    if not hmac.compare_digest(supplied, f"Bearer {RESULTS_TOKEN}".encode()):
+        return Response(403, 'forbidden')
+    if len(tallies) == 1:
+        body = next(iter(tallies.values())).to_json()
+    else:
+        # Joined as bytes so each election's cached serialization is reused as is.
+        body = b'{' + b','.join(
+            json.dumps(election_id).encode() + b':' + tally.to_json() for election_id, tally in tallies.items()
+        ) + b'}'
+    return Response(200, body, 'application/json')
+
+async def seed_from_storage(election, retry_interval=60, after=None):
+    """Seed the election's tally and voted index from ballots stored by earlier runs, once `after` is done."""
+    storage = election.storage
+    if after is not None:
+        await asyncio.wait([after])
+    while True:
+        try:
+            records = await storage.stored_records()
+            break
+        except Exception as e:
+            logger.error(f"Failed to read stored votes, retrying in {retry_interval}s: {e}")
+            await asyncio.sleep(retry_interval)
+    election.tally.seed(records)
+    await election.voted.reconcile(records)
+    await election.voted.seed(records)
+
+async def follow_storage(tally, storage, interval=2, voted=None):
+    """Scale-out: count ballots committed by every worker as they reach the shared ballot database.
+
+    A worker passes its `voted` index to settle the claims its shard left pending before a restart.
+    """
+    rowid = 0
+    while True:
+        try:
+            records, rowid = await storage.records_since(rowid)
+            if not tally.seeded:
+                if voted is not None:
+                    await voted.reconcile(records, owns=lambda chat_id: chat_id % WORKER_COUNT == WORKER_INDEX)
+                tally.seed(records)
+            elif records:
+                tally.extend(records)
+        except Exception as e:
+            logger.error(f"Failed to read new ballots for the tally: {e}")
+        await asyncio.sleep(interval)
+
+async def metrics(request):
+    return Response(200, REGISTRY.render(), 'text/plain; version=0.0.4; charset=utf-8')
+
+def register_metrics(application: Application):
+    elections = list(application.bot_data['elections'].values())
+    storages = [election.storage for election in elections]
+    # Elections hosted together share one writer and one Sheets breaker; each is counted once.
+    writers = list({storage.writer for storage in storages if storage.writer is not None})
+    breakers = list({storage.sheets.breaker for storage in storages if storage.sheets is not None})
+    sessions = application.bot_data['sessions']
+    REGISTRY.gauge('election_voters_registered', 'Voters in the loaded rosters.',
+                   lambda: sum(len(election.registry) for election in elections))
+    processor = application.update_processor
+    if isinstance(processor, ChatSerializedProcessor):
+        REGISTRY.gauge('election_update_chats_active', 'Chats with an update being handled or waiting.', lambda: processor.active_chats)
+    scheduler = application.bot.rate_limiter
+    if scheduler is not None:
+        REGISTRY.gauge('election_send_queue_depth', 'Outgoing calls waiting for the global send rate.', lambda: scheduler.queue_depth)
+        REGISTRY.gauge('election_send_chats_tracked', 'Chats with a per-chat send bucket.', lambda: scheduler.tracked_chats)
+    if writers:
+        REGISTRY.gauge('election_vote_queue_depth', 'Ballots waiting for the sheet writer.',
+                       lambda: sum(writer.queue_depth for writer in writers))
+        REGISTRY.gauge('election_vote_batches_total', 'append_rows batches attempted.',
+                       lambda: sum(writer.batches for writer in writers))
+        REGISTRY.gauge('election_votes_committed_total', 'Ballots written to the sheet.',
+                       lambda: sum(writer.committed for writer in writers))
+        REGISTRY.gauge('election_votes_failed_total', 'Ballot writes that failed and will be retried.',
+                       lambda: sum(writer.failed for writer in writers))
+        REGISTRY.gauge('election_vote_batch_latency_seconds', 'Latency of the last append_rows batch.',
+                       lambda: max(writer.last_batch_latency for writer in writers))
+        REGISTRY.gauge('election_vote_batch_latency_mean_seconds', 'Mean append_rows batch latency.',
+                       lambda: sum(writer.total_batch_latency for writer in writers) / (sum(writer.batches for writer in writers) or 1))
+    REGISTRY.gauge('election_voters_voted', 'Voters in the has-voted indexes.',
+                   lambda: sum(len(election.voted) for election in elections))
+    if breakers:
+        REGISTRY.gauge('election_sheets_circuit_open', 'Whether calls to Google Sheets are paused (1) or allowed (0).',
+                       lambda: int(any(breaker.is_open for breaker in breakers)))
+        REGISTRY.gauge('election_sheets_circuit_trips_total', 'Times the Sheets circuit breaker has opened.',
+                       lambda: sum(breaker.opened for breaker in breakers))
+    REGISTRY.gauge('election_ballots_unsynced', 'Stored ballots not yet on the sheet.',
+                   lambda: sum(storage.unsynced for storage in storages))
+    REGISTRY.gauge('election_sessions_active', 'Voter sessions held in memory.', lambda: len(sessions))
+    REGISTRY.gauge('election_sessions_evicted_total', 'Voter sessions evicted for idleness or the cap.', lambda: sessions.evicted)
+    REGISTRY.gauge('election_resident_memory_bytes', 'Resident memory of the bot process.', resident_memory_bytes)
+
+async def telegram_webhook(request, application):
+    if WEBHOOK_SECRET and request.headers.get('x-telegram-bot-api-secret-token') != WEBHOOK_SECRET:
+        return Response(403, 'forbidden')
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return Response(400, 'invalid json')
+    await application.update_queue.put(Update.de_json(data, application.bot))
+    return Response(200)
+
+async def prewarm_sheets(sheets):
+    """Authorize and open the worksheet off the critical path, so no voter waits for the OAuth exchange."""
+    started = time.perf_counter()
+    try:
+        await sheets.run(sheets.connect)
+    except Exception as e:
+        logger.error(f"Failed to setup Google Sheets, will retry on first vote: {e}")
+    else:
+        logger.info(f"Google Sheets ready {time.perf_counter() - started:.2f}s after startup.")
+
+async def post_init(application: Application):
+    elections = application.bot_data['elections'].values()
+    # Elections hosted together share a Sheets session, but each spreadsheet is opened on its own.
+    sheets = {election.storage.sheets for election in elections if election.storage.sheets is not None}
+    prewarm = {client: asyncio.create_task(prewarm_sheets(client)) for client in sheets if client.spreadsheet_id}
+    if prewarm:
+        application.bot_data['sheets_prewarm'] = asyncio.gather(*prewarm.values())
+    application.bot_data['sessions'].seed(application.user_data.keys())
+    application.bot_data['sessions'].start()
+    for election in elections:
+        election.registry.start()
+        election.storage.start()
+        if WORKER_INDEX is None:
+            # Reading the sheet before it is open would hold a second of the session's few Sheets threads
+            # waiting on the same connect, so with several elections the seeds wait for their prewarm.
+            election.seed_task = asyncio.create_task(
+                seed_from_storage(election, after=prewarm.get(election.storage.sheets)))
+        else:
+            # Claims from every worker are already in the shared voted index.
+            election.seed_task = asyncio.create_task(
+                follow_storage(election.tally, election.storage, voted=election.voted))
+
+async def post_shutdown(application: Application):
+    for task in application.bot_data['ballot_edits'].values():
+        task.cancel()
+    if 'sheets_prewarm' in application.bot_data:
+        application.bot_data['sheets_prewarm'].cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await application.bot_data['sheets_prewarm']
+    elections = application.bot_data['elections'].values()
+    for election in elections:
+        if election.reminders is not None:
+            # Deliveries so far are recorded; /remind after the restart resumes the broadcast.
+            election.reminders[1].cancel()
+        election.seed_task.cancel()
+    for election in elections:
+        await election.storage.stop()
+        await election.registry.stop()
+    for session in {election.storage.sheets.session for election in elections if election.storage.sheets is not None}:
+        session.close()
+    await application.bot_data['sessions'].stop()
+    for election in elections:
+        election.voted.close()
+    application.bot_data['contacts'].close()
+    TRACER.close()
+
+def build_storage(kind, sheets, journal_path=VOTE_JOURNAL, db_path=VOTE_DB, csv_path=VOTE_CSV, writer=None):
+    """Build the ballot store; `writer` is a VoteWriter shared with other elections, else one is made."""
+    if kind == 'sheets':
+        journal = VoteJournal(journal_path)
+        journal.open()
+        return SheetsStorage(journal, writer or VoteWriter(sheets), sheets)
+    if kind == 'sqlite':
+        writer = (writer or VoteWriter(sheets)) if sheets.spreadsheet_id else None
+        return SQLiteStorage(db_path, writer, sheets)
+    if kind == 'csv':
+        return CSVStorage(csv_path, sheets.headers)
+    raise SystemExit(f"Unknown VOTE_STORAGE {kind!r}; use sheets, sqlite or csv.")
+
+def setup_application(application: Application, elections, contacts, inline=BALLOT_MODE == 'inline'):
+    """Attach the hosted elections and shared components to the application and register its handlers."""
+    ballots = [election.ballot for election in elections]
+    if inline:
+        for ballot in ballots:
+            if ballot.inline_buttons > MAX_INLINE_BUTTONS:
+                raise SystemExit(f"An inline ballot can hold at most {MAX_INLINE_BUTTONS} buttons; "
+                                 f"this one needs {ballot.inline_buttons}. Use BALLOT_MODE=keyboard.")
+    STATE_NAMES.update(state_names(ballots))
+    application.bot_data['inline'] = inline
+    application.bot_data['elections'] = {election.id: election for election in elections}
+    application.bot_data['contacts'] = contacts
+    application.bot_data['profiler'] = Profiler(PROFILE_DIR)
+    # chat ID -> pending show_answers task of an inline ballot
+    application.bot_data['ballot_edits'] = {}
+    application.bot_data['sessions'] = SessionReaper(application, SESSION_TTL, MAX_SESSIONS)
+    register_metrics(application)
+
+    application.add_handler(TypeHandler(Update, track_session), group=-1)
+    application.add_handler(build_conversation(ballots, inline))
     application.add_handler(CommandHandler('help', help_command))
+    application.add_handler(CommandHandler('results', results_command))
+    application.add_handler(CommandHandler('remind', remind_command))
+    application.add_handler(CommandHandler('remind_stop', remind_stop_command))
+    application.add_handler(CommandHandler('profile', profile_command))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, unhandled))
+    application.add_handler(CallbackQueryHandler(unhandled))
+
+def election_path(template, election_id):
+    """Per-election file next to `template`: votes.db becomes votes-<id>.db."""
+    root, extension = os.path.splitext(template)
+    return f"{root}-{election_id}{extension}"
+
+def load_election(ballot):
+    """The single election configured by BALLOT_FILE, ROSTER_DB and SPREADSHEET_ID."""
+    # Deployments still editing the legacy JSON files get each change re-imported, at startup and while running.
+    refresh = functools.partial(import_json_if_changed, LEGACY_ROSTER_FILES, ROSTER_DB)
+    refresh()
+    registry = VoterRegistry(ROSTER_DB, refresh=refresh)
+    registry.load()
+
+    if WORKER_INDEX is not None:
+        storage = SQLiteStorage(VOTE_DB)
+    else:
+        # Connected in the background by post_init, once updates are already being accepted.
+        storage = build_storage(VOTE_STORAGE, SheetsClient(SPREADSHEET_ID, ballot.columns + [BALLOT_ID_HEADER]))
+
+    # Answers "has this voter voted?" immediately after a restart; the sheet is reconciled in the background.
+    voted = VotedIndex(
+        STATE_DB, compact=VOTED_INDEX_COMPACT, capacity=max(len(registry), 1000), shared=WORKER_INDEX is not None
+    )
+    voted.load()
+    return Election('', ballot, registry, storage, voted, live=WORKER_INDEX is None)
+
+def load_elections(path, state_db):
+    """Build every election in the ELECTIONS file around one Sheets session and one vote writer."""
+    session = SheetsSession()
+    writer = VoteWriter()
+    elections = []
+    for entry in load_config(path, VOTE_STORAGE):
+        election_id = entry['id']
+        ballot = Ballot.load(entry['ballot'], FIRST_RACE_STATE)
+        registry = VoterRegistry(entry['roster'])
+        registry.load()
+        sheets = SheetsClient(entry.get('spreadsheet_id'), ballot.columns + [BALLOT_ID_HEADER], session=session)
+        storage = build_storage(
+            entry.get('storage', VOTE_STORAGE).lower(), sheets,
+            entry.get('journal', election_path(VOTE_JOURNAL, election_id)),
+            entry.get('vote_db', election_path(VOTE_DB, election_id)),
+            entry.get('csv', election_path(VOTE_CSV, election_id)),
+            writer,
+        )
+        voted = VotedIndex(state_db, compact=VOTED_INDEX_COMPACT, capacity=max(len(registry), 1000), namespace=election_id)
+        voted.load()
+        elections.append(Election(election_id, ballot, registry, storage, voted))
+    logger.info(f"Hosting {len(elections)} elections: {', '.join(election.id for election in elections)}.")
+    return elections
+
+def main():
+    if BOT_MODE == 'webhook' and not WEBHOOK_URL and WORKER_INDEX is None:
+        raise SystemExit("BOT_MODE=webhook requires WEBHOOK_URL to be set.")
+    if BALLOT_MODE not in ('keyboard', 'inline'):
+        raise SystemExit(f"Unknown BALLOT_MODE {BALLOT_MODE!r}; use keyboard or inline.")
+    if (WORKERS > 1 or WORKER_INDEX is not None) and VOTE_STORAGE != 'sqlite':
+        raise SystemExit("WORKERS > 1 requires VOTE_STORAGE=sqlite so workers share one ballot database.")
+    if ELECTIONS and (WORKERS > 1 or WORKER_INDEX is not None):
+        raise SystemExit("ELECTIONS cannot be combined with WORKERS > 1; scale-out hosts a single election.")
+
+    TRACER.configure(TRACE_FILE, TRACE_SAMPLE_RATE, TRACE_SLOW_SECONDS)
+    if ELECTIONS:
+        elections = load_elections(ELECTIONS, STATE_DB)
+    else:
+        ballot = Ballot.load(BALLOT_FILE, FIRST_RACE_STATE)
+        if WORKERS > 1 and WORKER_INDEX is None:
+            # The ingress is the only process that writes to the sheet; it connects on the first mirror.
+            storage = build_storage(VOTE_STORAGE, SheetsClient(SPREADSHEET_ID, ballot.columns + [BALLOT_ID_HEADER]))
+            asyncio.run(run_ingress(Ingress(WORKERS, PORT + 1, WEBHOOK_PATH), storage, Tally(ballot, live=False)))
+            return
+        elections = [load_election(ballot)]
+    shard = (WORKER_INDEX, WORKER_COUNT) if WORKER_INDEX is not None else None
 
-    server_thread = threading.Thread(target=run_dummy_server)
-    server_thread.start()
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .request(TimedRequest())
+        # Workers split the global send rate between them.
+        .rate_limiter(SendScheduler(SEND_RATE / WORKER_COUNT))
+        .concurrent_updates(ChatSerializedProcessor(MAX_CONCURRENT_UPDATES))
+        .persistence(SQLitePersistence(STATE_DB, shard=shard))
+    )
+    if BOT_MODE == 'webhook' or WORKER_INDEX is not None:
+        builder = builder.updater(None)
+    application = builder.build()
+    setup_application(application, elections, ContactBook(STATE_DB))
+
+    asyncio.run(run(application))
+
+async def run(application: Application):
+    if WORKER_INDEX is not None:
+        # Only the ingress on this machine talks to workers.
+        server = HTTPServer('127.0.0.1', PORT)
+        server.route('POST', WEBHOOK_PATH, lambda request: telegram_webhook(request, application))
+    else:
+        server = HTTPServer(port=PORT)
+        if BOT_MODE == 'webhook':
+            server.route('POST', WEBHOOK_PATH, lambda request: telegram_webhook(request, application))
+    server.route('GET', '/healthz', healthz)
+    server.route('GET', '/readyz', lambda request: readyz(request, application))
+    server.route('GET', '/metrics', metrics)
+    if RESULTS_TOKEN:
+        server.route('GET', '/results', lambda request: results_json(
+            request, {election_id: election.tally for election_id, election in application.bot_data['elections'].items()}))
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    loop.add_signal_handler(signal.SIGUSR1, start_profile, application, PROFILE_SECONDS)
+
+    async with application:
+        await post_init(application)
+        await application.start()
+        await server.start()
+        if WORKER_INDEX is not None:
+            logger.info(f"🤖 Worker {WORKER_INDEX + 1}/{WORKER_COUNT} receiving updates from the ingress.")
+        elif BOT_MODE == 'webhook':
+            await application.bot.set_webhook(
+                WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                allowed_updates=Update.ALL_TYPES,
+                secret_token=WEBHOOK_SECRET or None
+            )
+            logger.info(f"🤖 Receiving updates by webhook on {WEBHOOK_PATH}.")
+        else:
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            logger.info("🤖 Receiving updates by long polling.")
+        try:
+            await stop_event.wait()
+        finally:
+            await server.stop()
+            if application.updater and application.updater.running:
+                await application.updater.stop()
+            await application.stop()
+            await post_shutdown(application)
 
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+async def ingress_webhook(request, ingress):
+    if WEBHOOK_SECRET and request.headers.get('x-telegram-bot-api-secret-token') != WEBHOOK_SECRET:
+        return Response(403, 'forbidden')
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return Response(400, 'invalid json')
+    # A non-200 makes Telegram deliver the update again later.
+    if await ingress.dispatch(data):
+        return Response(200)
+    return Response(503, 'worker unavailable')
+
+async def ingress_readyz(request, ingress):
+    if ingress.ready:
+        return Response(200, 'ready')
+    return Response(503, 'not ready')
+
+async def run_ingress(ingress: Ingress, storage, tally):
+    """Scale-out: receive updates and shard them to workers, mirror ballots to the sheet, serve results."""
+    server = HTTPServer(port=PORT)
+    server.route('GET', '/healthz', healthz)
+    server.route('GET', '/readyz', lambda request: ingress_readyz(request, ingress))
+    server.route('GET', '/metrics', metrics)
+    if RESULTS_TOKEN:
+        server.route('GET', '/results', lambda request: results_json(request, {'': tally}))
+    if BOT_MODE == 'webhook':
+        server.route('POST', WEBHOOK_PATH, lambda request: ingress_webhook(request, ingress))
+    REGISTRY.gauge('election_workers_alive', 'Scale-out worker processes running.',
+                   lambda: sum(worker.alive for worker in ingress.workers))
+    REGISTRY.gauge('election_ballots_unsynced', 'Stored ballots not yet on the sheet.', lambda: storage.unsynced)
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    async with Bot(TELEGRAM_BOT_TOKEN) as bot:
+        await ingress.start()
+        storage.start()
+        follower = asyncio.create_task(follow_storage(tally, storage))
+        await server.start()
+        poller = None
+        if BOT_MODE == 'webhook':
+            await bot.set_webhook(
+                WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                allowed_updates=Update.ALL_TYPES,
+                secret_token=WEBHOOK_SECRET or None
+            )
+        else:
+            poller = asyncio.create_task(poll_updates(bot, ingress, Update.ALL_TYPES))
+        logger.info(f"🤖 Ingress sharding updates across {len(ingress.workers)} workers.")
+        try:
+            await stop_event.wait()
+        finally:
+            await server.stop()
+            for task in (poller, follower):
+                if task is not None:
+                    task.cancel()
+            await ingress.stop()
+            await storage.stop()
+            storage.sheets.session.close()
 
 if __name__ == "__main__":
     main()
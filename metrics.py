@@ -0,0 +1,144 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for values, count in list(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {count}")
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket latency histogram with optional labels.
+
+    Observations only bump a bucket counter, so recording on the handler path
+    is a bisect and three additions. Safe to observe from worker threads.
+    """
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), then sum, then count.
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return series[-1] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(values, list(series)) for values, series in self._series.items()]
+        for values, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    """Collects metrics and renders them in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._gauges = {}
+
+    def counter(self, name, help_text, labels=()):
+        return self._metrics.setdefault(name, Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._metrics.setdefault(name, Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name, help_text, fn):
+        """Register a gauge whose value is read from `fn()` at scrape time."""
+        self._gauges[name] = (help_text, fn)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        for name, (help_text, fn) in list(self._gauges.items()):
+            try:
+                value = fn()
+            except Exception as e:
+                logger.error(f"Failed to read metric {name}: {e}")
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = REGISTRY.histogram(
+    'election_handler_latency_seconds', 'Time spent in a conversation handler.', ('state',))
+EXTERNAL_CALL_LATENCY = REGISTRY.histogram(
+    'election_external_call_latency_seconds', 'Latency of calls to Telegram and Google Sheets.', ('call',))
+STATE_TRANSITIONS = REGISTRY.counter(
+    'election_state_transitions_total', 'Conversation state changes.', ('from_state', 'to_state'))
+INVALID_INPUTS = REGISTRY.counter(
+    'election_invalid_inputs_total', 'Replies rejected as invalid, by state.', ('state',))
+DROPOFFS = REGISTRY.counter(
+    'election_dropoffs_total', 'Conversations abandoned by /cancel or restarting with /start, by state.', ('state',))
+SEND_WAIT = REGISTRY.histogram(
+    'election_send_wait_seconds', 'Time an outgoing Bot API call waited for the send scheduler, by priority.', ('priority',))
+FLOOD_WAITS = REGISTRY.counter(
+    'election_flood_waits_total', 'RetryAfter responses from Telegram, by Bot API method.', ('method',))
+SHEETS_RETRIES = REGISTRY.counter(
+    'election_sheets_retries_total', 'Google Sheets requests retried after a quota or server error, by call.', ('call',))
@@ -0,0 +1,88 @@
+"""On-demand profiling of a running bot, started by /profile or SIGUSR1.
+
+For the requested number of seconds cProfile records every call on the event
+loop thread, while a sampler thread records the loop thread's stack at a fixed
+interval. The samples show where wall-clock time went, including time spent
+blocked. Three files are written to the profile directory: a readable .txt
+report, a .pstats dump for snakeviz or pstats, and a .stacks file in the
+collapsed format that flamegraph.pl and speedscope read.
+"""
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+def _stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Profiler:
+    def __init__(self, directory='.', sample_interval=0.005):
+        self.directory = directory
+        self.sample_interval = sample_interval
+        self.running = False
+
+    def _sample(self, thread_id, stacks, stop):
+        while not stop.wait(self.sample_interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                stacks[_stack(frame)] += 1
+
+    async def run(self, seconds):
+        """Profile the event loop for `seconds` and return the path of the text report."""
+        if self.running:
+            raise RuntimeError("A profile is already running.")
+        self.running = True
+        base = os.path.join(self.directory, time.strftime('profile-%Y%m%d-%H%M%S'))
+        profile = cProfile.Profile()
+        stacks = Counter()
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sample, args=(threading.get_ident(), stacks, stop), daemon=True)
+        logger.info(f"Profiling for {seconds}s.")
+        sampler.start()
+        profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+            stop.set()
+            sampler.join()
+            self.running = False
+        return await asyncio.to_thread(self._write, base, profile, stacks, seconds)
+
+    def _write(self, base, profile, stacks, seconds):
+        profile.dump_stats(base + '.pstats')
+        with open(base + '.stacks', 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        total = sum(stacks.values()) or 1
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        report = io.StringIO()
+        report.write(f"Profile of {seconds}s, {total} wall-clock samples every {self.sample_interval * 1000:.0f} ms\n\n")
+        report.write("Wall-clock samples by innermost function (the event loop's selector is idle time):\n")
+        for leaf, count in leaves.most_common(30):
+            report.write(f"{count / total * 100:6.1f}%  {leaf}\n")
+        for order in ('cumulative', 'tottime'):
+            report.write(f"\ncProfile of the event loop thread by {order} time:\n")
+            pstats.Stats(profile, stream=report).sort_stats(order).print_stats(40)
+        with open(base + '.txt', 'w') as f:
+            f.write(report.getvalue())
+        logger.info(f"Profile written to {base}.txt")
+        return base + '.txt'
@@ -0,0 +1,230 @@
+"""Reminder broadcasts to registered voters who have not voted yet.
+
+The roster holds emails, not Telegram chats, so the bot keeps a contact book
+of every chat that has talked to it and the email it verified as, if any. A
+broadcast goes to each contact that has not voted, recording every delivery
+so a job interrupted by /remind_stop or a restart resumes where it stopped.
+Contacts and broadcasts belong to an election; a single-election bot uses ''.
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+
+from telegram.error import Forbidden, TelegramError
+
+from metrics import REGISTRY
+from send_scheduler import BULK
+
+logger = logging.getLogger(__name__)
+
+REMINDERS = REGISTRY.counter('election_reminders_total', 'Reminder messages by outcome.', ('result',))
+
+SENT = 'sent'
+BLOCKED = 'blocked'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    election TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    email TEXT,
+    seen_at INTEGER NOT NULL,
+    PRIMARY KEY (election, chat_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    election TEXT NOT NULL,
+    text TEXT NOT NULL,
+    started_at INTEGER NOT NULL,
+    finished_at INTEGER
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    broadcast_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (broadcast_id, chat_id)
+) WITHOUT ROWID;
+"""
+
+
+class ContactBook:
+    """Chats that have talked to the bot, and reminder broadcasts with their deliveries, in SQLite."""
+
+    def __init__(self, path='bot_state.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._migrate()
+        self._db.executescript(SCHEMA)
+
+    def _migrate(self):
+        """Move contacts and broadcasts from before elections were scoped into the '' election."""
+        columns = [row[1] for row in self._db.execute('PRAGMA table_info(contacts)')]
+        if columns and 'election' not in columns:
+            self._db.executescript("""
+                BEGIN;
+                ALTER TABLE contacts RENAME TO contacts_unscoped;
+                ALTER TABLE broadcasts ADD COLUMN election TEXT NOT NULL DEFAULT '';
+            """ + SCHEMA + """
+                INSERT INTO contacts (election, chat_id, email, seen_at)
+                    SELECT '', chat_id, email, seen_at FROM contacts_unscoped;
+                DROP TABLE contacts_unscoped;
+                COMMIT;
+            """)
+            logger.info(f"Scoped existing contacts and broadcasts in {self.path} to the default election.")
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    async def record(self, chat_id, email=None, election=''):
+        """Remember a chat taking part in `election`, and the email it verified as once known."""
+        await asyncio.to_thread(
+            self._execute,
+            'INSERT INTO contacts (election, chat_id, email, seen_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (election, chat_id) DO UPDATE '
+            'SET seen_at = excluded.seen_at, email = COALESCE(excluded.email, contacts.email)',
+            (election, chat_id, email, int(time.time())),
+        )
+
+    def contacts(self, election=''):
+        return self._execute('SELECT chat_id, email FROM contacts WHERE election = ?', (election,))
+
+    def open_broadcast(self, text, election=''):
+        """Return (id, text, resumed) of the election's unfinished broadcast, or of a new one sending `text`."""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT id, text FROM broadcasts WHERE election = ? AND finished_at IS NULL ORDER BY id DESC LIMIT 1',
+                (election,)
+            ).fetchone()
+            if row is not None:
+                return row[0], row[1], True
+            cursor = self._db.execute(
+                'INSERT INTO broadcasts (election, text, started_at) VALUES (?, ?, ?)', (election, text, int(time.time()))
+            )
+            return cursor.lastrowid, text, False
+
+    def finish_broadcast(self, broadcast_id):
+        self._execute('UPDATE broadcasts SET finished_at = ? WHERE id = ?', (int(time.time()), broadcast_id))
+
+    def settled(self, broadcast_id):
+        """Chats this broadcast needs no further attempt at: reached, or blocked the bot."""
+        rows = self._execute(
+            'SELECT chat_id FROM deliveries WHERE broadcast_id = ? AND status != ?', (broadcast_id, FAILED)
+        )
+        return {chat_id for chat_id, in rows}
+
+    def record_deliveries(self, broadcast_id, results):
+        with self._lock:
+            self._db.execute('BEGIN')
+            self._db.executemany(
+                'INSERT OR REPLACE INTO deliveries (broadcast_id, chat_id, status) VALUES (?, ?, ?)',
+                [(broadcast_id, chat_id, status) for chat_id, status in results],
+            )
+            self._db.execute('COMMIT')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ReminderBroadcast:
+    """Sends one broadcast to every contact who is registered and has not voted.
+
+    `concurrency` sends are in flight at once, each queued at BULK priority in
+    the send scheduler, so ballot prompts always go out first and the
+    broadcast only uses the send rate voters leave idle. Voters are checked
+    again just before their reminder, so anyone who votes meanwhile is skipped.
+    """
+
+    def __init__(self, book, registry, voted, bot, broadcast_id, text, concurrency=8, batch_size=100, election=''):
+        self.book = book
+        self.election = election
+        self.registry = registry
+        self.voted = voted
+        self.bot = bot
+        self.id = broadcast_id
+        self.text = text
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.counts = {SENT: 0, BLOCKED: 0, FAILED: 0}
+        self.skipped = 0
+        self.total = 0
+        self.started = None
+        self._results = []
+
+    def _pending(self, chat_id, email):
+        # A chat that never verified may not be on the roster at all, so it is not reminded.
+        if email is None or self.voted.has_voted(email=email, chat_id=chat_id):
+            return False
+        return email in self.registry
+
+    def _targets(self, contacts, settled):
+        return [(chat_id, email) for chat_id, email in contacts
+                if chat_id not in settled and self._pending(chat_id, email)]
+
+    @property
+    def done(self):
+        return sum(self.counts.values()) + self.skipped
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return self.counts[SENT] / elapsed if elapsed else 0.0
+
+    def progress(self):
+        return (f"{self.done}/{self.total} reminders done: {self.counts[SENT]} sent, {self.counts[BLOCKED]} blocked, "
+                f"{self.counts[FAILED]} failed, {self.skipped} voted meanwhile; {self.rate:.1f} sent/s")
+
+    async def _send(self, chat_id):
+        try:
+            await self.bot.send_message(chat_id, self.text, rate_limit_args=BULK)
+            return SENT
+        except Forbidden:
+            return BLOCKED
+        except TelegramError as e:
+            logger.warning(f"Reminder to {chat_id} failed: {e}")
+            return FAILED
+
+    async def _flush(self):
+        results, self._results = self._results, []
+        if results:
+            await asyncio.to_thread(self.book.record_deliveries, self.id, results)
+
+    async def run(self):
+        """Send every outstanding reminder. Returns True if none failed, finishing the broadcast."""
+        self.started = time.monotonic()
+        settled = await asyncio.to_thread(self.book.settled, self.id)
+        contacts = await asyncio.to_thread(self.book.contacts, self.election)
+        # Checking every contact against the roster and voted index takes over a second for 100k
+        # contacts, so it runs off the event loop.
+        targets = await asyncio.to_thread(self._targets, contacts, settled)
+        self.total = len(targets)
+        targets.reverse()
+
+        async def sender():
+            while targets:
+                chat_id, email = targets.pop()
+                if not self._pending(chat_id, email):
+                    self.skipped += 1
+                    continue
+                status = await self._send(chat_id)
+                self.counts[status] += 1
+                REMINDERS.inc(status)
+                self._results.append((chat_id, status))
+                if len(self._results) >= self.batch_size:
+                    await self._flush()
+
+        try:
+            await asyncio.gather(*(sender() for _ in range(self.concurrency)))
+        finally:
+            await self._flush()
+        logger.info(f"Reminder broadcast {self.id}: {self.progress()}")
+        if self.counts[FAILED]:
+            return False
+        await asyncio.to_thread(self.book.finish_broadcast, self.id)
+        return True
@@ -0,0 +1,323 @@
+"""Export the stored ballots and a signed, certified summary once polls close.
+
+    python results_export.py --out results.csv --summary results_summary.json
+    python results_export.py --db votes.db --out results.parquet
+    python results_export.py --verify results_summary.json
+
+Ballots are read a page at a time, from the sheet in ranged reads or from the
+bot's SQLite ballot store with --db. Each page is streamed to the export file
+(CSV, or Parquet with pyarrow) and folded into the counts before the next
+page is read, so memory stays bounded by the page size plus one short digest
+per voter. Rows repeating a Ballot ID are replays of the same ballot and are
+skipped. After the first ballot from an email or chat ID, any later ballot
+from it is listed as a duplicate and not counted. The counts are vectorized
+with numpy when it is installed.
+
+The summary carries per-race counts, blank and spoiled answers, duplicates
+and hourly turnout. It is signed with HMAC-SHA256 under RESULTS_SIGNING_KEY,
+and --verify checks a summary against the same key.
+"""
+import argparse
+import csv
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+
+from ballot import Ballot
+from sheets_client import SheetsClient
+from vote_journal import BALLOT_ID_HEADER
+from voter_registry import normalize_email
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+COUNTING_RULE = "first ballot per email and per chat ID; later ones are listed as duplicates and not counted"
+
+
+def count_values(values):
+    """Counter of a page's values, vectorized when numpy is installed."""
+    if numpy is None or len(values) == 0:
+        return Counter(values)
+    unique, counts = numpy.unique(numpy.asarray(values, dtype=str), return_counts=True)
+    return Counter(dict(zip(unique.tolist(), counts.tolist())))
+
+
+def hour_counts(timestamps):
+    """Counter of ISO timestamps by hour, as 'YYYY-MM-DDTHH' prefixes."""
+    if numpy is None or not timestamps:
+        return Counter(timestamp[:13] for timestamp in timestamps)
+    # Converting to 13-character strings truncates every timestamp to its hour at once.
+    return count_values(numpy.asarray(timestamps, dtype='U13'))
+
+
+def _digest(value):
+    return hashlib.blake2b(value.encode(), digest_size=8).digest()
+
+
+class ResultsAnalyzer:
+    """Folds pages of ballot records into certified counts, duplicates and turnout."""
+
+    def __init__(self, ballot):
+        self.ballot = ballot
+        self.rows = 0
+        self.replayed = 0
+        self.counted = 0
+        self.tallies = {race.column: Counter() for race in ballot.races}
+        self.blank = Counter()
+        self.spoiled = Counter()
+        self.turnout = Counter()
+        self.invalid_timestamps = 0
+        self.duplicate_emails = Counter()
+        self.duplicate_chats = Counter()
+        self._ballot_ids = set()
+        self._voters = set()
+
+    def _first_ballot(self, record):
+        """Whether this is the first ballot from its email and its chat, remembering both."""
+        email = normalize_email(record.get('Email', ''))
+        chat_id = str(record.get('Chat ID', ''))
+        first = True
+        if email:
+            if _digest('e' + email) in self._voters:
+                self.duplicate_emails[email] += 1
+                first = False
+            self._voters.add(_digest('e' + email))
+        if chat_id:
+            if _digest('c' + chat_id) in self._voters:
+                self.duplicate_chats[chat_id] += 1
+                first = False
+            self._voters.add(_digest('c' + chat_id))
+        return first
+
+    def add_page(self, records):
+        counted = []
+        for record in records:
+            self.rows += 1
+            ballot_id = record.get(BALLOT_ID_HEADER, '')
+            if ballot_id:
+                digest = _digest(ballot_id)
+                if digest in self._ballot_ids:
+                    self.replayed += 1
+                    continue
+                self._ballot_ids.add(digest)
+            if self._first_ballot(record):
+                counted.append(record)
+        self.counted += len(counted)
+        for race in self.ballot.races:
+            for value, count in count_values([record.get(race.column, '') for record in counted]).items():
+                if not value:
+                    self.blank[race.column] += count
+                elif value in race.choices:
+                    self.tallies[race.column][value] += count
+                else:
+                    self.spoiled[race.column] += count
+        for hour, count in hour_counts([record.get('Timestamp', '') for record in counted]).items():
+            # The sheet may have reformatted ISO timestamps with a space for the 'T'.
+            if len(hour) == 13 and hour[10] in 'T ':
+                self.turnout[hour[:10] + 'T' + hour[11:]] += count
+            else:
+                self.invalid_timestamps += count
+
+    def turnout_series(self):
+        """Ballots per hour from the first to the last ballot, including hours with none."""
+        if not self.turnout:
+            return []
+        hour = datetime.strptime(min(self.turnout), '%Y-%m-%dT%H')
+        last = datetime.strptime(max(self.turnout), '%Y-%m-%dT%H')
+        series = []
+        cumulative = 0
+        while hour <= last:
+            ballots = self.turnout.get(hour.strftime('%Y-%m-%dT%H'), 0)
+            cumulative += ballots
+            series.append({'hour': hour.strftime('%Y-%m-%dT%H:00'), 'ballots': ballots, 'cumulative': cumulative})
+            hour += timedelta(hours=1)
+        return series
+
+    def summary(self):
+        return {
+            'election': self.ballot.name,
+            'counting_rule': COUNTING_RULE,
+            'rows_read': self.rows,
+            'replayed_rows': self.replayed,
+            'ballots_counted': self.counted,
+            'races': [
+                {
+                    'key': race.key,
+                    'label': race.label,
+                    'column': race.column,
+                    'counts': {choice: self.tallies[race.column][choice] for choice in race.choices},
+                    'blank': self.blank[race.column],
+                    'spoiled': self.spoiled[race.column],
+                }
+                for race in self.ballot.races
+            ],
+            'duplicates': {
+                'emails': dict(self.duplicate_emails.most_common()),
+                'chat_ids': dict(self.duplicate_chats.most_common()),
+            },
+            'turnout_by_hour': self.turnout_series(),
+            'invalid_timestamps': self.invalid_timestamps,
+        }
+
+
+class CSVExport:
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.DictWriter(self._file, columns, extrasaction='ignore')
+        self._writer.writeheader()
+
+    def write(self, records):
+        self._writer.writerows(records)
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetExport:
+    """Row groups of string columns, one per page, written with pyarrow."""
+
+    def __init__(self, path, columns):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Exporting to Parquet needs pyarrow: pip install pyarrow")
+        self.path = path
+        self.columns = columns
+        self._pyarrow = pyarrow
+        self._writer = pyarrow.parquet.ParquetWriter(
+            path, pyarrow.schema([(column, pyarrow.string()) for column in columns])
+        )
+
+    def write(self, records):
+        columns = {column: [str(record.get(column, '')) for record in records] for column in self.columns}
+        self._writer.write_table(self._pyarrow.table(columns))
+
+    def close(self):
+        self._writer.close()
+
+
+def iter_db_pages(path, page_size=1000):
+    """Yield the ballots in the bot's SQLite store in commit order, `page_size` records at a time."""
+    db = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        cursor = db.execute('SELECT record FROM ballots ORDER BY rowid')
+        while True:
+            rows = cursor.fetchmany(page_size)
+            if not rows:
+                return
+            yield [json.loads(record) for record, in rows]
+    finally:
+        db.close()
+
+
+def iter_sheet_pages(sheets, page_size=1000):
+    """Yield the sheet's ballots a page at a time, leaving out blank rows and rows with no voter."""
+    skipped = 0
+    for records in sheets.iter_pages(page_size):
+        ballots = [record for record in records if record.get('Email') or record.get('Chat ID')]
+        skipped += len(records) - len(ballots)
+        yield ballots
+    if skipped:
+        logger.warning(f"Skipped {skipped} sheet rows with no Email or Chat ID.")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sign(summary, key):
+    body = json.dumps(summary, sort_keys=True, separators=(',', ':')).encode()
+    return hmac.new(key, body, hashlib.sha256).hexdigest()
+
+
+def verify(document, key):
+    signature = document.get('signature', {})
+    return signature.get('algorithm') == 'HMAC-SHA256' and hmac.compare_digest(
+        signature.get('value', ''), sign(document['summary'], key)
+    )
+
+
+def export(pages, exporter, analyzer):
+    started = time.perf_counter()
+    try:
+        for records in pages:
+            exporter.write(records)
+            analyzer.add_page(records)
+    finally:
+        exporter.close()
+    elapsed = time.perf_counter() - started
+    logger.info(f"Exported {analyzer.rows} rows to {exporter.path} in {elapsed:.1f}s "
+                f"({analyzer.rows / elapsed if elapsed else 0:.0f} rows/s).")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Export ballots and a signed results summary.")
+    parser.add_argument('--db', help="read the bot's SQLite ballot store instead of the sheet")
+    parser.add_argument('--ballot', default=os.getenv('BALLOT_FILE', 'ballot.json'))
+    parser.add_argument('--out', default='results.csv', help="export file; .parquet writes Parquet")
+    parser.add_argument('--summary', default='results_summary.json', help="signed summary to write")
+    parser.add_argument('--page-size', type=int, default=1000, help="rows per read")
+    parser.add_argument('--verify', metavar='SUMMARY', help="check a summary's signature and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    key = os.getenv('RESULTS_SIGNING_KEY', '').encode()
+    if not key:
+        raise SystemExit("Set RESULTS_SIGNING_KEY to sign or verify a results summary.")
+    if args.verify:
+        with open(args.verify) as f:
+            valid = verify(json.load(f), key)
+        print(f"{args.verify}: signature {'valid' if valid else 'INVALID'}")
+        raise SystemExit(0 if valid else 1)
+
+    ballot = Ballot.load(args.ballot)
+    columns = ballot.columns + [BALLOT_ID_HEADER]
+    if args.db:
+        source = f"sqlite:{args.db}"
+        pages = iter_db_pages(args.db, args.page_size)
+    else:
+        sheets = SheetsClient(os.getenv('SPREADSHEET_ID'), columns)
+        # Certifying the sheet must not change it, so its header row is read as it stands.
+        sheets.connect(read_only=True)
+        columns = sheets.columns
+        source = f"sheet:{sheets.spreadsheet_id}"
+        pages = iter_sheet_pages(sheets, args.page_size)
+    exporter = (ParquetExport if args.out.lower().endswith('.parquet') else CSVExport)(args.out, columns)
+    analyzer = ResultsAnalyzer(ballot)
+    export(pages, exporter, analyzer)
+
+    summary = analyzer.summary()
+    summary.update({
+        'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'source': source,
+        'export': {'path': os.path.basename(args.out), 'sha256': file_sha256(args.out), 'rows': analyzer.rows},
+    })
+    with open(args.summary, 'w') as f:
+        json.dump({'summary': summary, 'signature': {'algorithm': 'HMAC-SHA256', 'value': sign(summary, key)}}, f, indent=2)
+    logger.info(f"Counted {analyzer.counted} ballots; {sum(analyzer.duplicate_emails.values())} duplicate by email, "
+                f"{sum(analyzer.duplicate_chats.values())} by chat ID, {analyzer.replayed} replayed rows. "
+                f"Signed summary written to {args.summary}.")
+
+
+if __name__ == "__main__":
+    main()
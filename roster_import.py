@@ -0,0 +1,163 @@
+"""Import a voter roster into the keyed store the bot verifies voters against.
+
+    python roster_import.py members.csv
+    python roster_import.py members.xlsx --sheet Members --email-column "E-mail"
+    python roster_import.py --json voter_emails.json voter_names.json verification_codes.json
+
+CSV and XLSX rosters are streamed row by row (XLSX needs openpyxl). Emails are
+normalized, names folded, and codes kept only as keyed hashes under a salt
+generated per import. The store is built beside the target and swapped in
+atomically, so a running bot picks up the new roster on its next poll.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import time
+
+from voter_registry import ROSTER_DB, LEGACY_ROSTER_FILES, normalize_email, fold_name, hash_code
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE voters (
+    email TEXT PRIMARY KEY,
+    name_key TEXT NOT NULL,
+    code_hash BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def _column_indexes(header, columns):
+    folded = [str(cell or '').strip().casefold() for cell in header]
+    indexes = []
+    for column in columns:
+        if column.casefold() not in folded:
+            raise SystemExit(f"Roster has no {column!r} column; found {[str(cell) for cell in header]}.")
+        indexes.append(folded.index(column.casefold()))
+    return indexes
+
+
+def read_csv(path, columns):
+    """Yield (email, name, code) from a CSV roster with a header row."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        indexes = _column_indexes(next(reader, []), columns)
+        for row in reader:
+            yield tuple(row[i] if i < len(row) else '' for i in indexes)
+
+
+def read_xlsx(path, columns, sheet=None):
+    """Yield (email, name, code) from an XLSX roster without loading the workbook into memory."""
+    try:
+        import openpyxl
+    except ImportError:
+        raise SystemExit("Importing .xlsx rosters needs openpyxl: pip install openpyxl")
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = (workbook[sheet] if sheet else workbook.active).iter_rows(values_only=True)
+        indexes = _column_indexes(next(rows, ()), columns)
+        for row in rows:
+            yield tuple(str(row[i]) if i < len(row) and row[i] is not None else '' for i in indexes)
+    finally:
+        workbook.close()
+
+
+def read_json(paths=LEGACY_ROSTER_FILES):
+    """Yield (email, name, code) from the legacy three parallel JSON arrays."""
+    roster = []
+    for path in paths:
+        with open(path, 'r') as f:
+            roster.append(json.load(f))
+    emails, names, codes = roster
+    for i, email in enumerate(emails):
+        yield str(email), str(names[i]) if i < len(names) else '', str(codes[i]) if i < len(codes) else ''
+
+
+def import_json_if_changed(paths=LEGACY_ROSTER_FILES, path=ROSTER_DB):
+    """Re-import the legacy JSON roster into `path` if any of its files is newer than the store.
+
+    Returns the import's (imported, skipped), or None if the store is current or the files are absent.
+    """
+    if not all(os.path.exists(source) for source in paths):
+        return None
+    if os.path.exists(path) and os.stat(path).st_mtime_ns >= max(os.stat(source).st_mtime_ns for source in paths):
+        return None
+    count, skipped = import_roster(read_json(paths), path)
+    logger.info(f"Imported {count} voters from the legacy JSON roster into {path}.")
+    return count, skipped
+
+
+def import_roster(rows, path=ROSTER_DB, batch_size=5000):
+    """Write (email, name, code) rows to a new roster store at `path`. Returns (imported, skipped)."""
+    tmp = path + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    salt = secrets.token_bytes(32)
+    db = sqlite3.connect(tmp, isolation_level=None)
+    try:
+        db.execute('PRAGMA journal_mode=OFF')
+        db.execute('PRAGMA synchronous=OFF')
+        db.executescript(SCHEMA)
+        skipped = 0
+        batch = []
+
+        def flush():
+            db.execute('BEGIN')
+            db.executemany('INSERT OR REPLACE INTO voters (email, name_key, code_hash) VALUES (?, ?, ?)', batch)
+            db.execute('COMMIT')
+            batch.clear()
+
+        for email, name, code in rows:
+            email = normalize_email(email)
+            if '@' not in email or not code.strip():
+                skipped += 1
+                continue
+            batch.append((email, fold_name(name), hash_code(salt, email, code)))
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        count = db.execute('SELECT COUNT(*) FROM voters').fetchone()[0]
+        db.executemany('INSERT INTO meta (key, value) VALUES (?, ?)', [
+            ('salt', salt.hex()), ('count', str(count)), ('imported_at', str(int(time.time()))),
+        ])
+    finally:
+        db.close()
+    with open(tmp, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return count, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a voter roster for the election bot.")
+    parser.add_argument('source', nargs='*', help="a .csv or .xlsx roster, or three files with --json")
+    parser.add_argument('--json', action='store_true', help="import the legacy emails, names and codes JSON arrays")
+    parser.add_argument('--db', default=os.getenv('ROSTER_DB', ROSTER_DB), help="roster store to write")
+    parser.add_argument('--sheet', help="worksheet to read from an .xlsx roster (default: the first)")
+    parser.add_argument('--email-column', default='Email')
+    parser.add_argument('--name-column', default='Name')
+    parser.add_argument('--code-column', default='Code')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    columns = (args.email_column, args.name_column, args.code_column)
+    if args.json:
+        rows = read_json(args.source or LEGACY_ROSTER_FILES)
+    elif len(args.source) != 1:
+        parser.error("give exactly one .csv or .xlsx roster")
+    elif args.source[0].lower().endswith('.xlsx'):
+        rows = read_xlsx(args.source[0], columns, args.sheet)
+    else:
+        rows = read_csv(args.source[0], columns)
+    count, skipped = import_roster(rows, args.db)
+    logger.info(f"Imported {count} voters into {args.db}, skipped {skipped} rows without an email or code.")
+
+
+if __name__ == "__main__":
+    main()
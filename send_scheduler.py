@@ -0,0 +1,170 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import SEND_WAIT, FLOOD_WAITS
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Priorities for `rate_limit_args`; lower is sent first.
+PROMPT = 0
+INFO = 1
+BULK = 2
+PRIORITY_NAMES = {PROMPT: 'prompt', INFO: 'info', BULK: 'bulk'}
+
+
+def retry_seconds(error):
+    """RetryAfter.retry_after as seconds, whether PTB reports an int or a timedelta."""
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def wait_time(self, now):
+        """Seconds until a token is available, refilling first."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class SendScheduler(BaseRateLimiter):
+    """Paces outgoing Bot API calls under Telegram's global and per-chat flood limits.
+
+    A call to a chat first waits for that chat's bucket, then joins a priority
+    queue drained at the global rate, so a ballot prompt never waits behind a
+    backlog of informational or bulk messages. A RetryAfter pauses every send
+    for the time Telegram asks and the call is retried.
+    """
+
+    def __init__(self, rate=30, private_rate=1, private_burst=3, group_rate=20 / 60, group_burst=3,
+                 max_retries=3, max_chats=10000):
+        self.rate = rate
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self.flood_waits = 0
+        self._global = TokenBucket(rate, rate)
+        self._chats = OrderedDict()
+        self._queue = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._wake = None
+        self._task = None
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    @property
+    def tracked_chats(self):
+        return len(self._chats)
+
+    async def initialize(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for _, _, future in self._queue:
+            future.cancel()
+        self._queue.clear()
+
+    def _chat(self, chat_id):
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            group = isinstance(chat_id, int) and chat_id < 0
+            bucket = TokenBucket(self.group_rate, self.group_burst) if group else TokenBucket(self.private_rate, self.private_burst)
+            entry = self._chats[chat_id] = (bucket, asyncio.Lock())
+            # Forgetting a quiet chat only resets its bucket to a full burst.
+            if len(self._chats) > self.max_chats:
+                oldest = next(iter(self._chats))
+                if not self._chats[oldest][1].locked():
+                    del self._chats[oldest]
+        else:
+            self._chats.move_to_end(chat_id)
+        return entry
+
+    async def _acquire_chat(self, chat_id):
+        bucket, lock = self._chat(chat_id)
+        async with lock:
+            while True:
+                wait = bucket.wait_time(time.monotonic())
+                if wait <= 0:
+                    bucket.take()
+                    return
+                await asyncio.sleep(wait)
+
+    async def _acquire_global(self, priority):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), future))
+        self._wake.set()
+        await future
+
+    async def _dispatch(self):
+        while True:
+            if not self._queue:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            now = time.monotonic()
+            wait = max(self._paused_until - now, self._global.wait_time(now))
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                self._global.take()
+                future.set_result(None)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = PROMPT if rate_limit_args is None else rate_limit_args
+        chat_id = data.get('chat_id')
+        attempt = 0
+        while True:
+            # Calls not addressed to a chat (getMe, setWebhook, ...) are not paced.
+            if chat_id is not None:
+                started = time.monotonic()
+                with span('send.wait', method=endpoint):
+                    await self._acquire_chat(chat_id)
+                    await self._acquire_global(priority)
+                SEND_WAIT.observe(time.monotonic() - started, PRIORITY_NAMES.get(priority, str(priority)))
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                delay = retry_seconds(e)
+                self.flood_waits += 1
+                FLOOD_WAITS.inc(endpoint)
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                logger.warning(f"Telegram flood limit on {endpoint}, pausing sends for {delay:.0f}s (retry {attempt}).")
+                if chat_id is None:
+                    await asyncio.sleep(delay)
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import os
+import resource
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def resident_memory_bytes():
+    """Current RSS of this process, falling back to peak RSS where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class SessionReaper:
+    """Bounds per-voter session memory with an idle TTL and a hard cap.
+
+    Sessions are kept in least-recently-active order, so both eviction rules
+    only ever look at the front of the list. Evicting drops the voter's
+    user_data; their next message finds no session and they are asked to
+    /start again. Evicted voters are remembered, up to `max_sessions` of them,
+    so a message no conversation state takes can still be answered that way.
+    """
+
+    def __init__(self, application, ttl=1800, max_sessions=20000, interval=60):
+        self.application = application
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.interval = interval
+        self.evicted = 0
+        self._last_seen = OrderedDict()
+        self._evicted = OrderedDict()
+        self._task = None
+
+    def __len__(self):
+        return len(self._last_seen)
+
+    def touch(self, user_id):
+        self._last_seen[user_id] = time.monotonic()
+        self._last_seen.move_to_end(user_id)
+
+    def seed(self, user_ids):
+        """Track sessions restored from persistence as if they were active now."""
+        for user_id in user_ids:
+            self.touch(user_id)
+
+    def pop_evicted(self, user_id):
+        """Whether `user_id`'s session was evicted since they were last told; forgets it either way."""
+        return self._evicted.pop(user_id, False)
+
+    def sweep(self):
+        cutoff = time.monotonic() - self.ttl
+        evicted = 0
+        while self._last_seen:
+            user_id, last_seen = next(iter(self._last_seen.items()))
+            if last_seen > cutoff and len(self._last_seen) <= self.max_sessions:
+                break
+            del self._last_seen[user_id]
+            self.application.drop_user_data(user_id)
+            self._evicted[user_id] = True
+            if len(self._evicted) > self.max_sessions:
+                self._evicted.popitem(last=False)
+            evicted += 1
+        if evicted:
+            self.evicted += evicted
+            logger.info(f"Evicted {evicted} idle voter sessions, {len(self._last_seen)} remain.")
+        return evicted
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.sweep()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
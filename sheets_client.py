@@ -0,0 +1,312 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import EXTERNAL_CALL_LATENCY, SHEETS_RETRIES
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+SCOPE = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+
+
+class SheetsUnavailable(Exception):
+    """Raised without contacting Google while the circuit breaker is open."""
+
+
+def is_retryable(error, idempotent=True):
+    """Whether a failed call may succeed if repeated.
+
+    A 5xx or dropped connection may come after the request was applied, so
+    only idempotent calls are retried on those; a 429 was always rejected.
+    """
+    import gspread
+    import requests
+
+    if isinstance(error, gspread.exceptions.APIError):
+        status = error.response.status_code
+        return status == 429 or (idempotent and status >= 500)
+    return idempotent and isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+class QuotaLimiter:
+    """Blocks the calling thread so at most `per_minute` requests start in any 60 second window."""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self._starts = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._starts and now - self._starts[0] >= 60:
+                    self._starts.popleft()
+                if len(self._starts) < self.per_minute:
+                    self._starts.append(now)
+                    return
+                wait = 60 - (now - self._starts[0])
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Stops calls to a failing service, then lets a single trial call through after a cool-down.
+
+    Each failed trial doubles the cool-down up to `max_reset_timeout`.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold=5, reset_timeout=30, max_reset_timeout=300):
+        self.threshold = threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.state != self.CLOSED
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Google Sheets is responding again, closing the circuit breaker.")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.reset_timeout = self.base_reset_timeout
+            self._trial_running = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN:
+                self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+            elif self.failures < self.threshold:
+                return
+            self.state = self.OPEN
+            self.opened += 1
+            self._opened_at = time.monotonic()
+            self._trial_running = False
+            logger.warning(f"Google Sheets is failing, pausing calls for {self.reset_timeout}s.")
+
+
+class SheetsSession:
+    """The service account authorization, quota budget and circuit breaker behind one or more spreadsheets.
+
+    Google applies quotas per service account rather than per spreadsheet, so
+    clients for several elections' sheets share one session. They authorize
+    once and pace their requests together.
+
+    Sheets calls block for as long as the quota wait or retry backoff lasts,
+    up to a minute, so run() gives them `threads` threads of their own rather
+    than the default executor the journal, voted index and persistence rely
+    on. Every request gives up after `timeout` seconds, so a hung connection
+    counts as a failure towards the circuit breaker.
+    """
+
+    def __init__(self, credentials_file='credentials.json', read_per_minute=60, write_per_minute=60, breaker=None,
+                 timeout=30, threads=4):
+        self.credentials_file = credentials_file
+        self.quotas = {'read': QuotaLimiter(read_per_minute), 'write': QuotaLimiter(write_per_minute)}
+        self.breaker = breaker or CircuitBreaker()
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='sheets')
+        self._client = None
+        self._lock = threading.Lock()
+
+    async def run(self, fn, *args):
+        """Run a blocking Sheets call on the session's threads, traced like asyncio.to_thread."""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(context.run, fn, *args))
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def client(self):
+        """The authorized gspread client, created on first use."""
+        with self._lock:
+            if self._client is None:
+                import gspread
+
+                with span('sheets.auth'), EXTERNAL_CALL_LATENCY.time('sheets.auth'):
+                    client = gspread.service_account(filename=self.credentials_file, scopes=SCOPE)
+                client.set_timeout(self.timeout)
+                self._client = client
+            return self._client
+
+
+class SheetsClient:
+    """Process-wide Google Sheets handle, authorized once and shared by all handlers.
+
+    The service account session refreshes its access token on its own, and the
+    header row is verified once on connect so each append is a single request.
+    Every API call is paced under the per-minute read and write quotas, retried
+    with jittered exponential backoff, and refused outright while the circuit
+    breaker is open. Pass a shared `session` to hold several spreadsheets to
+    one authorization and quota budget.
+    """
+
+    def __init__(self, spreadsheet_id, headers, credentials_file='credentials.json', read_per_minute=60,
+                 write_per_minute=60, max_attempts=5, backoff_base=1, backoff_cap=32, breaker=None, session=None):
+        self.spreadsheet_id = spreadsheet_id
+        self.headers = list(headers)
+        self.session = session or SheetsSession(credentials_file, read_per_minute, write_per_minute, breaker)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker = self.session.breaker
+        self.columns = None
+        self._quotas = self.session.quotas
+        self._sheet = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self._sheet is not None
+
+    async def run(self, fn, *args):
+        """Run a blocking call such as append_records on the session's Sheets threads."""
+        return await self.session.run(fn, *args)
+
+    def _call(self, kind, label, fn, *args, idempotent=True):
+        """Run one Sheets API request of `kind` ('read' or 'write') under quota, backoff and breaker."""
+        if not self.breaker.allow():
+            raise SheetsUnavailable("Google Sheets circuit breaker is open")
+        for attempt in range(1, self.max_attempts + 1):
+            self._quotas[kind].acquire()
+            try:
+                with span(label, attempt=attempt), EXTERNAL_CALL_LATENCY.time(label):
+                    result = fn(*args)
+            except Exception as e:
+                import gspread
+
+                if not is_retryable(e, idempotent):
+                    if isinstance(e, gspread.exceptions.APIError) and e.response.status_code < 500:
+                        # Google is up; the request itself was rejected.
+                        self.breaker.success()
+                    else:
+                        self.breaker.failure()
+                    raise
+                if attempt == self.max_attempts:
+                    self.breaker.failure()
+                    raise
+                SHEETS_RETRIES.inc(label)
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** (attempt - 1)))
+                logger.warning(f"{label} failed ({e}), retrying in {delay:.1f}s.")
+                time.sleep(delay)
+            else:
+                self.breaker.success()
+                return result
+
+    def connect(self, read_only=False):
+        """Authorize, open the worksheet and cache its column layout. Safe to call repeatedly.
+
+        gspread and google-auth are imported on the first connect, not at module load,
+        keeping them off the path between process start and the first reply. With
+        `read_only` the header row is taken as it is and never written, for tools
+        that only audit the sheet.
+        """
+        with self._lock:
+            if self._sheet is not None:
+                return self._sheet
+            client = self.session.client()
+            sheet = self._call('read', 'sheets.open', lambda: client.open_by_key(self.spreadsheet_id).sheet1)
+            self.columns = self._read_headers(sheet) if read_only else self._verify_headers(sheet)
+            self._sheet = sheet
+            logger.info(f"Connected to Google Sheets with columns {self.columns}.")
+            return sheet
+
+    def _read_headers(self, sheet):
+        current = self._call('read', 'sheets.headers', sheet.row_values, 1)
+        missing = [h for h in self.headers if h not in current]
+        if missing:
+            logger.warning(f"Sheet header row lacks columns {missing}; they are read as blank.")
+        return current or list(self.headers)
+
+    def _verify_headers(self, sheet):
+        current = self._call('read', 'sheets.headers', sheet.row_values, 1)
+        if not current:
+            self._call('write', 'sheets.headers', sheet.append_row, self.headers, idempotent=False)
+            return list(self.headers)
+        if current != self.headers:
+            # Never clear a sheet that already holds votes; extend the header row instead.
+            missing = [h for h in self.headers if h not in current]
+            if missing:
+                current = current + missing
+                self._call('write', 'sheets.headers', sheet.update, [current], 'A1')
+            logger.warning(f"Sheet header differs from expected layout, writing by column name: {current}")
+        return current
+
+    @property
+    def sheet(self):
+        return self._sheet if self._sheet is not None else self.connect()
+
+    def build_row(self, record):
+        """Order a {header: value} record to match the sheet's column layout."""
+        return [record.get(column, '') for column in self.columns]
+
+    def append_record(self, record):
+        sheet = self.sheet
+        self._call('write', 'sheets.append', sheet.append_row, self.build_row(record), idempotent=False)
+
+    def append_records(self, records):
+        """Append several records with a single append_rows request."""
+        sheet = self.sheet
+        rows = [self.build_row(record) for record in records]
+        self._call('write', 'sheets.append', sheet.append_rows, rows, idempotent=False)
+
+    def column_values(self, header):
+        """Return every value below the header in the named column."""
+        sheet = self.sheet
+        if header not in self.columns:
+            return []
+        return self._call('read', 'sheets.read', sheet.col_values, self.columns.index(header) + 1)[1:]
+
+    def iter_pages(self, page_size=1000):
+        """Yield the data rows as lists of {column: value} dicts, reading one range of `page_size` rows per request."""
+        from gspread.utils import rowcol_to_a1
+
+        sheet = self.sheet
+        last_column = rowcol_to_a1(1, len(self.columns)).rstrip('0123456789')
+        start = 2
+        while True:
+            end = start + page_size - 1
+            rows = self._call('read', 'sheets.read', sheet.get, f"A{start}:{last_column}{end}")
+            if not rows:
+                return
+            yield [dict(zip(self.columns, row)) for row in rows]
+            if len(rows) < page_size:
+                return
+            start = end + 1
+
+    def all_records(self):
+        """Read every data row in one request, as {column: value} dicts."""
+        sheet = self.sheet
+        rows = self._call('read', 'sheets.read', sheet.get_all_values)
+        return [dict(zip(rows[0], row)) for row in rows[1:]] if rows else []
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (name, key)
+);
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+
+class SQLitePersistence(BasePersistence):
+    """Conversation state and user_data kept in a local SQLite database in WAL mode.
+
+    The application only hands over the conversations and users that changed
+    since the last flush, so each write is a single-row upsert rather than a
+    dump of everything. `update_interval` bounds how much a crash can lose.
+    With `shard=(index, count)` only the chats a scale-out worker owns
+    (chat ID modulo count) are loaded.
+    """
+
+    def __init__(self, path='bot_state.db', update_interval=1, shard=None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self.shard = shard
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    async def _run(self, sql, params=()):
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    def _owns(self, chat_id):
+        return self.shard is None or chat_id % self.shard[1] == self.shard[0]
+
+    async def get_conversations(self, name):
+        rows = await self._run('SELECT key, state FROM conversations WHERE name = ?', (name,))
+        conversations = {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+        return {key: state for key, state in conversations.items() if self._owns(key[0])}
+
+    async def update_conversation(self, name, key, new_state):
+        if new_state is None:
+            await self._run('DELETE FROM conversations WHERE name = ? AND key = ?', (name, json.dumps(key)))
+        else:
+            await self._run(
+                'INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)',
+                (name, json.dumps(key), json.dumps(new_state)),
+            )
+
+    async def get_user_data(self):
+        rows = await self._run('SELECT user_id, data FROM user_data')
+        # Voters talk to the bot in private chats, where the chat ID is the user ID.
+        return {user_id: json.loads(data) for user_id, data in rows if self._owns(user_id)}
+
+    async def update_user_data(self, user_id, data):
+        await self._run(
+            'INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)',
+            (user_id, json.dumps(data, separators=(',', ':'))),
+        )
+
+    async def drop_user_data(self, user_id):
+        await self._run('DELETE FROM user_data WHERE user_id = ?', (user_id,))
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def get_chat_data(self):
+        return {}
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def get_bot_data(self):
+        return {}
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def flush(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,162 @@
+"""Measure how long a cold bot process takes to answer its first voter, entirely offline.
+
+    python startup_bench.py --runs 5 --sheets-auth-latency 1.5
+
+Each run starts a fresh interpreter, as an auto-started machine does, which
+imports the bot, builds the Application with the real persistence, storage and
+scheduler, starts accepting updates and sends /start from one voter. Bot API
+calls are answered by loadtest's fake request and the sheet lives in memory,
+with --sheets-auth-latency standing in for the OAuth exchange. Every phase is
+timed from the moment the process was spawned; --eager-sheets connects to the
+sheet before accepting updates, as the bot used to, for comparison.
+
+For a breakdown of import time, run `python -X importtime startup_bench.py --child ...`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+STARTED = time.monotonic()
+
+PHASES = ('interpreter', 'imported', 'built', 'accepting', 'first_reply', 'sheets_ready')
+
+
+async def first_reply(args, marks):
+    import loadtest
+    import main as bot
+    from telegram import Update
+    from telegram.ext import Application
+    from ballot import Ballot
+    from elections import Election
+    from fake_telegram import message_update
+    from send_scheduler import SendScheduler
+    from sqlite_persistence import SQLitePersistence
+    from update_processor import ChatSerializedProcessor
+    from vote_journal import BALLOT_ID_HEADER
+    from voted_index import VotedIndex
+    from reminders import ContactBook
+    from voter_registry import VoterRegistry
+    marks['imported'] = time.monotonic()
+
+    with tempfile.TemporaryDirectory() as directory:
+        ballot = Ballot.load(args.ballot, bot.FIRST_RACE_STATE)
+        registry = VoterRegistry(args.roster)
+        registry.load()
+        sheets = loadtest.MemorySheets(ballot.columns + [BALLOT_ID_HEADER], auth_latency=args.sheets_auth_latency)
+        if args.eager_sheets:
+            sheets.connect()
+        storage = bot.build_storage(
+            args.storage, sheets,
+            journal_path=os.path.join(directory, 'votes.journal'),
+            db_path=os.path.join(directory, 'votes.db'),
+            csv_path=os.path.join(directory, 'votes.csv'),
+        )
+        state_db = os.path.join(directory, 'bot_state.db')
+        voted = VotedIndex(state_db, capacity=len(registry))
+        voted.load()
+        request = loadtest.FakeBotRequest(args.bot_latency)
+        application = (
+            Application.builder()
+            .token('123456:startup')
+            .request(request)
+            .updater(None)
+            .rate_limiter(SendScheduler())
+            .concurrent_updates(ChatSerializedProcessor())
+            .persistence(SQLitePersistence(state_db))
+            .build()
+        )
+        bot.setup_application(application, [Election('', ballot, registry, storage, voted)], ContactBook(state_db))
+        marks['built'] = time.monotonic()
+
+        async with application:
+            await bot.post_init(application)
+            await application.start()
+            marks['accepting'] = time.monotonic()
+            chat_id = 10_000_000
+            await application.update_queue.put(Update.de_json(message_update(chat_id, '/start'), application.bot))
+            await asyncio.wait_for(request.replies(chat_id).get(), args.timeout)
+            marks['first_reply'] = time.monotonic()
+            if 'sheets_prewarm' in application.bot_data:
+                await application.bot_data['sheets_prewarm']
+            marks['sheets_ready'] = time.monotonic()
+            await application.stop()
+            await bot.post_shutdown(application)
+
+
+def child(args):
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+    marks = {'interpreter': STARTED}
+    asyncio.run(first_reply(args, marks))
+    print(json.dumps(marks))
+
+
+def run_once(args, roster):
+    command = [
+        sys.executable, os.path.abspath(__file__), '--child', '--roster', roster, '--ballot', args.ballot,
+        '--storage', args.storage, '--bot-latency', str(args.bot_latency),
+        '--sheets-auth-latency', str(args.sheets_auth_latency), '--timeout', str(args.timeout),
+    ]
+    if args.eager_sheets:
+        command.append('--eager-sheets')
+    # CLOCK_MONOTONIC is shared by every process on the machine, so marks compare directly.
+    spawned = time.monotonic()
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    marks = json.loads(output.strip().splitlines()[-1])
+    return {phase: marks[phase] - spawned for phase in PHASES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time a cold start of the bot up to its first reply.")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--voters', type=int, default=1000, help="size of the synthetic roster")
+    parser.add_argument('--ballot', default='ballot.json')
+    parser.add_argument('--storage', choices=('sheets', 'sqlite', 'csv'), default='sheets')
+    parser.add_argument('--bot-latency', type=float, default=0.05, help="seconds per Bot API call")
+    parser.add_argument('--sheets-auth-latency', type=float, default=1.0, help="seconds to authorize and open the sheet")
+    parser.add_argument('--eager-sheets', action='store_true', help="connect to the sheet before accepting updates")
+    parser.add_argument('--timeout', type=float, default=30, help="seconds to wait for the first reply")
+    parser.add_argument('--json', metavar='PATH', help="also write the report as JSON, for comparing runs")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--roster', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    from roster_import import import_roster
+    with tempfile.TemporaryDirectory() as directory:
+        roster = os.path.join(directory, 'roster.db')
+        import_roster(((f"voter{i}@example.com", f"Voter {i}", f"CODE{i:06d}") for i in range(args.voters)), roster)
+        runs = [run_once(args, roster) for _ in range(args.runs)]
+
+    report = {
+        'runs': args.runs,
+        'storage': args.storage,
+        'eager_sheets': args.eager_sheets,
+        'sheets_auth_latency': args.sheets_auth_latency,
+        'phases': {
+            phase: {'median': statistics.median(run[phase] for run in runs), 'max': max(run[phase] for run in runs)}
+            for phase in PHASES
+        },
+    }
+    print(f"{args.runs} cold starts, {args.storage} storage, sheets auth {args.sheets_auth_latency * 1000:.0f} ms"
+          f"{', eager sheets' if args.eager_sheets else ''}; seconds since spawn:")
+    print(f"{'phase':<16}{'median':>10}{'max':>10}")
+    for phase, stats in report['phases'].items():
+        print(f"{phase:<16}{stats['median']:>10.3f}{stats['max']:>10.3f}")
+    print(f"time to first reply {report['phases']['first_reply']['median']:.3f} s")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
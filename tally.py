@@ -0,0 +1,82 @@
+import json
+import logging
+
+from vote_journal import BALLOT_ID_HEADER
+
+logger = logging.getLogger(__name__)
+
+
+class Tally:
+    """Running per-race vote counts, updated as each ballot is committed.
+
+    Seeded once from a bulk read of the sheet; after that every query is
+    answered from memory. Ballots counted live before seeding finishes are
+    remembered by Ballot ID so the seed does not count them twice. With
+    `live=False` (scale-out workers) add() is ignored and every ballot is
+    counted from the shared store instead.
+    """
+
+    def __init__(self, ballot, live=True):
+        self.ballot = ballot
+        self.live = live
+        self.counts = {race.key: dict.fromkeys(race.choices, 0) for race in ballot.races}
+        self.total = 0
+        self.seeded = False
+        self._live_keys = set()
+        self._json = None
+
+    def _count(self, record):
+        for race in self.ballot.races:
+            choice = record.get(race.column, '')
+            if choice:
+                counts = self.counts[race.key]
+                counts[choice] = counts.get(choice, 0) + 1
+        self.total += 1
+        self._json = None
+
+    def add(self, record):
+        """Count one committed ballot, given as a {sheet column: value} record."""
+        if not self.live:
+            return
+        if not self.seeded:
+            self._live_keys.add(record.get(BALLOT_ID_HEADER))
+        self._count(record)
+
+    def seed(self, records):
+        """Count ballots already stored before this process started."""
+        for record in records:
+            if record.get(BALLOT_ID_HEADER) not in self._live_keys:
+                self._count(record)
+        self._live_keys.clear()
+        self.seeded = True
+        logger.info(f"Seeded tally with {self.total} ballots.")
+
+    def extend(self, records):
+        """Count ballots committed elsewhere after seeding."""
+        for record in records:
+            self._count(record)
+
+    def snapshot(self):
+        return {
+            'ballots': self.total,
+            'seeded': self.seeded,
+            'races': [
+                {'key': race.key, 'label': race.label, 'counts': self.counts[race.key]}
+                for race in self.ballot.races
+            ],
+        }
+
+    def to_json(self):
+        """Serialized snapshot, cached until the next ballot is counted."""
+        if self._json is None:
+            self._json = json.dumps(self.snapshot()).encode()
+        return self._json
+
+    def format(self):
+        lines = [f"📊 Results ({self.total} ballots)"]
+        if not self.seeded:
+            lines.append("⚠️ Stored ballots are still loading; counts are partial.")
+        for race in self.ballot.races:
+            counts = ', '.join(f"{choice}: {count}" for choice, count in self.counts[race.key].items())
+            lines.append(f"• {race.label}: {counts}")
+        return '\n'.join(lines)
@@ -0,0 +1,123 @@
+"""Per-update tracing: one span per update, with a child span for each call it makes.
+
+The update processor opens a root span carrying the chat ID; the handler adds
+the conversation state; Bot API requests, send-scheduler waits, Sheets calls
+and roster, voted-index and ballot-store access each add a child span. The
+current span travels in a context variable, so spans opened in tasks and in
+asyncio.to_thread workers attach to the update that started them, and
+`span()` costs nothing outside an update.
+
+Traces slower than TRACE_SLOW_SECONDS are logged with their breakdown, and
+with TRACE_FILE set, those and a TRACE_SAMPLE_RATE sample of the rest are
+appended to it as JSON lines.
+"""
+import contextvars
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('span', default=None)
+
+
+class Span:
+    __slots__ = ('name', 'attributes', 'start', 'duration', 'children')
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.duration = None
+        self.children = []
+
+    def to_dict(self, origin):
+        entry = {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round((self.duration or 0) * 1000, 3),
+        }
+        if self.attributes:
+            entry['attributes'] = self.attributes
+        if self.children:
+            entry['children'] = [child.to_dict(origin) for child in self.children]
+        return entry
+
+    def describe(self):
+        """One line: the span's attributes, then its direct children and their durations."""
+        attributes = ' '.join(f"{key}={value}" for key, value in self.attributes.items())
+        children = ', '.join(f"{child.name} {(child.duration or 0) * 1000:.0f} ms" for child in self.children)
+        return f"{attributes}; {children or 'no external calls'}"
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a call as a child of the current update's span; does nothing outside an update."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, attributes)
+    parent.children.append(child)
+    token = _current.set(child)
+    try:
+        yield child
+    finally:
+        child.duration = time.perf_counter() - child.start
+        _current.reset(token)
+
+
+def annotate(**attributes):
+    """Add attributes to the current span, if any."""
+    current = _current.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+class Tracer:
+    def __init__(self):
+        self.path = None
+        self.sample_rate = 0.0
+        self.slow_seconds = None
+        self._file = None
+
+    def configure(self, path=None, sample_rate=0.0, slow_seconds=None):
+        self.path = path or None
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+
+    @contextmanager
+    def trace(self, name, **attributes):
+        """Open the root span of an update."""
+        root = Span(name, attributes)
+        token = _current.set(root)
+        try:
+            yield root
+        except BaseException as e:
+            root.attributes['error'] = type(e).__name__
+            raise
+        finally:
+            root.duration = time.perf_counter() - root.start
+            _current.reset(token)
+            self._finish(root)
+
+    def _finish(self, root):
+        slow = self.slow_seconds is not None and root.duration >= self.slow_seconds
+        if slow:
+            logger.warning(f"Slow {root.name} took {root.duration * 1000:.0f} ms: {root.describe()}")
+        if self.path and (slow or random.random() < self.sample_rate):
+            if self._file is None:
+                self._file = open(self.path, 'a', buffering=1)
+            entry = root.to_dict(root.start)
+            entry['time'] = time.time() - root.duration
+            self._file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+TRACER = Tracer()
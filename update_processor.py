@@ -0,0 +1,65 @@
+import asyncio
+import sys
+
+from telegram.ext import BaseUpdateProcessor
+
+from tracing import TRACER
+
+
+def chat_key(update):
+    """The chat an update belongs to, falling back to its user, or None for neither."""
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return None
+
+
+class ChatSerializedProcessor(BaseUpdateProcessor):
+    """Processes up to `max_concurrent_updates` updates at once, one at a time per chat.
+
+    An update takes its chat's lock before a worker slot, so a voter who sends
+    several messages quickly queues behind their own earlier update without
+    holding slots other voters could use. asyncio locks are FIFO, so each chat's
+    updates run in the order they arrived.
+    """
+
+    def __init__(self, max_concurrent_updates=64):
+        # The base class takes its semaphore before do_process_update, where a chat would hold a slot
+        # while it waits for its own earlier update. Its limit is never reached; slots are taken below.
+        super().__init__(sys.maxsize)
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._locks = {}
+
+    @property
+    def active_chats(self):
+        return len(self._locks)
+
+    async def do_process_update(self, update, coroutine):
+        key = chat_key(update)
+        if key is None:
+            async with self._slots:
+                await self._process(update, coroutine)
+            return
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._slots:
+                    await self._process(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def _process(self, update, coroutine):
+        with TRACER.trace('update', update_id=update.update_id, chat_id=chat_key(update)):
+            await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
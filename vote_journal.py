@@ -0,0 +1,225 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import struct
+import zlib
+
+logger = logging.getLogger(__name__)
+
+BALLOT_ID_HEADER = "Ballot ID"
+
+# Each record is <length:u32><crc32:u32><payload>, payload being compact JSON:
+#   ["b", key, record]  a completed ballot
+#   ["s", key]          that ballot has reached the sheet
+_HEADER = struct.Struct('>II')
+
+
+def ballot_key(chat_id, record):
+    digest = hashlib.sha256(json.dumps(record, sort_keys=True).encode()).hexdigest()[:16]
+    return f"{chat_id}-{digest}"
+
+
+def _encode(entry):
+    payload = json.dumps(entry, separators=(',', ':')).encode()
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+class VoteJournal:
+    """Append-only on-disk log of completed ballots, flushed with group commit.
+
+    Concurrent appends that arrive while an fsync is running are written and
+    synced together by the next flush, so many voters share one disk flush.
+    """
+
+    def __init__(self, path='votes.journal'):
+        self.path = path
+        self.unsynced = {}
+        self._file = None
+        # Bytes of whole, durable records; anything past it is the remains of a failed write.
+        self._size = 0
+        self._torn = False
+        self._pending = []
+        self._flush_task = None
+
+    def _scan(self):
+        ballots = {}
+        good = 0
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        while good + _HEADER.size <= len(data):
+            length, crc = _HEADER.unpack_from(data, good)
+            start = good + _HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            entry = json.loads(payload)
+            if entry[0] == 'b':
+                ballots[entry[1]] = entry[2]
+            else:
+                ballots.pop(entry[1], None)
+            good = start + length
+        if good < len(data):
+            logger.warning(f"Discarding {len(data) - good} bytes of torn journal tail in {self.path}.")
+        return ballots
+
+    def _rewrite(self, ballots):
+        # Compact to just the unsynced ballots, replacing the old file atomically.
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(b''.join(_encode(['b', key, record]) for key, record in ballots.items()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def open(self):
+        """Recover unsynced ballots from a previous run and open the journal for appending."""
+        if os.path.exists(self.path):
+            self.unsynced = self._scan()
+            self._rewrite(self.unsynced)
+        if self.unsynced:
+            logger.info(f"Recovered {len(self.unsynced)} unsynced ballots from {self.path}.")
+        self._file = open(self.path, 'ab', buffering=0)
+        self._size = self._file.seek(0, os.SEEK_END)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, chunks):
+        if self._torn:
+            # Records appended after torn bytes would be discarded with them by the next open().
+            self._file.truncate(self._size)
+            self._torn = False
+        data = b''.join(chunks)
+        try:
+            view = memoryview(data)
+            while view:
+                # An unbuffered write may take only part of the data.
+                view = view[self._file.write(view):]
+            os.fsync(self._file.fileno())
+        except BaseException:
+            self._torn = True
+            try:
+                self._file.truncate(self._size)
+                self._torn = False
+            except OSError as e:
+                logger.error(f"Failed to truncate {self.path} after a failed write, will retry: {e}")
+            raise
+        self._size += len(data)
+
+    async def _flush(self):
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._write, [chunk for chunk, _ in batch])
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} journal records: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for _, future in batch:
+                    future.set_result(None)
+
+    def _append(self, entry):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((_encode(entry), future))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush())
+        return future
+
+    async def append_ballot(self, chat_id, record):
+        """Durably journal a ballot. Returns its idempotency key and the keyed record."""
+        key = ballot_key(chat_id, record)
+        record = dict(record, **{BALLOT_ID_HEADER: key})
+        await self._append(['b', key, record])
+        self.unsynced[key] = record
+        return key, record
+
+    async def mark_synced(self, keys):
+        futures = [self._append(['s', key]) for key in keys if self.unsynced.pop(key, None) is not None]
+        if futures:
+            await asyncio.gather(*futures)
+
+
+class JournalReplayer:
+    """Moves journaled ballots to the sheet through the vote writer.
+
+    Ballots are retried until committed. Before a retry the Ballot ID column
+    is read once so ballots that already reached the sheet are not duplicated.
+    """
+
+    def __init__(self, journal, writer, sheets, interval=60):
+        self.journal = journal
+        self.writer = writer
+        self.sheets = sheets
+        self.interval = interval
+        self._in_flight = set()
+        self._tasks = set()
+        self._task = None
+
+    async def store(self, chat_id, record):
+        """Journal a ballot, then hand it to the writer in the background."""
+        key, record = await self.journal.append_ballot(chat_id, record)
+        self._submit(key, record)
+        return key
+
+    def _submit(self, key, record):
+        self._in_flight.add(key)
+        task = asyncio.get_running_loop().create_task(self._sync(key, record))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _sync(self, key, record):
+        try:
+            committed = await self.writer.submit(record, self.sheets)
+            if await committed:
+                await self.journal.mark_synced([key])
+        except Exception as e:
+            logger.error(f"Failed to sync ballot {key}: {e}")
+        finally:
+            self._in_flight.discard(key)
+
+    async def replay_once(self):
+        pending = {k: r for k, r in self.journal.unsynced.items() if k not in self._in_flight}
+        if not pending:
+            return
+        stored = set(await self.sheets.run(self.sheets.column_values, BALLOT_ID_HEADER))
+        await self.journal.mark_synced([key for key in pending if key in stored])
+        resend = [(key, record) for key, record in pending.items() if key not in stored]
+        for key, record in resend:
+            self._submit(key, record)
+        if resend:
+            logger.info(f"Replaying {len(resend)} journaled ballots to Google Sheets.")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.replay_once()
+            except Exception as e:
+                logger.error(f"Journal replay failed, will retry: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop retrying and wait for ballots already handed to the writer."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
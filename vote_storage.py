@@ -0,0 +1,295 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from vote_journal import JournalReplayer, ballot_key, BALLOT_ID_HEADER
+
+logger = logging.getLogger(__name__)
+
+
+class GroupCommit:
+    """Batches items submitted while a write is in progress into the next write.
+
+    `write` is a blocking callable taking a list of items; it runs in a worker
+    thread and every submitter's future resolves once the batch holding its
+    item is durable.
+    """
+
+    def __init__(self, write):
+        self.write = write
+        self._pending = []
+        self._task = None
+
+    async def _flush(self):
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self.write, [item for item, _ in batch])
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} ballots: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for _, future in batch:
+                    future.set_result(None)
+
+    def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._flush())
+        return future
+
+
+class SheetsStorage:
+    """Ballots journaled on local disk, then appended to Google Sheets in batches.
+
+    A ballot is stored once it is in the journal; the sheet is the system of
+    record and the journal only holds ballots that have not reached it yet.
+    """
+
+    def __init__(self, journal, writer, sheets):
+        self.journal = journal
+        self.writer = writer
+        self.sheets = sheets
+        self.replayer = JournalReplayer(journal, writer, sheets)
+
+    @property
+    def ready(self):
+        return self.writer.running
+
+    @property
+    def degraded(self):
+        """True while Google Sheets is refusing calls and ballots are only parked in the journal."""
+        return self.sheets.breaker.is_open
+
+    @property
+    def unsynced(self):
+        return len(self.journal.unsynced)
+
+    async def store(self, chat_id, record):
+        return await self.replayer.store(chat_id, record)
+
+    async def stored_records(self):
+        """Every ballot stored by earlier runs: the sheet plus journaled ballots not yet on it."""
+        records = await self.sheets.run(self.sheets.all_records)
+        on_sheet = {record.get(BALLOT_ID_HEADER) for record in records}
+        records.extend(record for key, record in self.journal.unsynced.items() if key not in on_sheet)
+        return records
+
+    def start(self):
+        self.writer.start()
+        self.replayer.start()
+
+    async def stop(self):
+        await self.replayer.stop()
+        await self.writer.stop()
+        self.journal.close()
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ballots (
+    ballot_id TEXT PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    mirrored INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ballots_unmirrored ON ballots (ballot_id) WHERE mirrored = 0;
+"""
+
+
+class SQLiteStorage:
+    """Ballots committed to a local SQLite database, optionally mirrored to the sheet.
+
+    Concurrent ballots share one transaction and one fsync, so throughput is
+    bounded by local disk. When a vote writer is given, a background job copies
+    ballots to the sheet for the committee to view; the sheet is then a mirror
+    and falling behind it never blocks voting.
+    """
+
+    degraded = False
+
+    def __init__(self, path='votes.db', writer=None, sheets=None, mirror_interval=5, mirror_batch=500):
+        self.path = path
+        self.writer = writer
+        self.sheets = sheets
+        self.mirror_interval = mirror_interval
+        self.mirror_batch = mirror_batch
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        # A committed ballot must survive power loss, not just a process crash.
+        self._db.execute('PRAGMA synchronous=FULL')
+        self._db.executescript(SQLITE_SCHEMA)
+        # Counted in the database, since in scale-out other processes store the ballots this one mirrors.
+        self.unsynced = self._count_unsynced() if writer is not None else 0
+        self._commits = GroupCommit(self._insert)
+        self._wake = asyncio.Event()
+        self._task = None
+
+    @property
+    def ready(self):
+        return self.writer is None or self.writer.running
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _insert(self, rows):
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                self._db.executemany(
+                    'INSERT OR IGNORE INTO ballots (ballot_id, chat_id, record) VALUES (?, ?, ?)', rows
+                )
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    def _count_unsynced(self):
+        return self._execute('SELECT COUNT(*) FROM ballots WHERE mirrored = 0')[0][0]
+
+    def _mark_mirrored(self, keys):
+        with self._lock:
+            self._db.executemany('UPDATE ballots SET mirrored = 1 WHERE ballot_id = ?', [(key,) for key in keys])
+
+    async def store(self, chat_id, record):
+        key = ballot_key(chat_id, record)
+        record = dict(record, **{BALLOT_ID_HEADER: key})
+        await self._commits.submit((key, chat_id, json.dumps(record, separators=(',', ':'))))
+        self._wake.set()
+        return key
+
+    async def stored_records(self):
+        rows = await asyncio.to_thread(self._execute, 'SELECT record FROM ballots')
+        return [json.loads(record) for record, in rows]
+
+    async def records_since(self, rowid=0):
+        """Ballots committed after `rowid`, by any process, and the rowid to pass next time."""
+        rows = await asyncio.to_thread(
+            self._execute, 'SELECT rowid, record FROM ballots WHERE rowid > ? ORDER BY rowid', (rowid,)
+        )
+        return [json.loads(record) for _, record in rows], rows[-1][0] if rows else rowid
+
+    async def mirror_once(self, check_sheet=False):
+        """Copy up to mirror_batch unmirrored ballots to the sheet. Returns how many were copied."""
+        rows = await asyncio.to_thread(
+            self._execute, 'SELECT ballot_id, record FROM ballots WHERE mirrored = 0 LIMIT ?', (self.mirror_batch,)
+        )
+        if not rows:
+            return 0
+        pending = {key: json.loads(record) for key, record in rows}
+        if check_sheet:
+            # After a restart some of these may have reached the sheet before being marked.
+            on_sheet = set(await self.sheets.run(self.sheets.column_values, BALLOT_ID_HEADER))
+            already = [key for key in pending if key in on_sheet]
+            if already:
+                await asyncio.to_thread(self._mark_mirrored, already)
+                for key in already:
+                    del pending[key]
+        futures = {key: await self.writer.submit(record, self.sheets) for key, record in pending.items()}
+        committed = [key for key, future in futures.items() if await future]
+        if committed:
+            await asyncio.to_thread(self._mark_mirrored, committed)
+        if len(committed) < len(pending):
+            raise RuntimeError(f"{len(pending) - len(committed)} ballots were not mirrored to the sheet")
+        return len(committed)
+
+    async def _mirror(self):
+        check_sheet = True
+        while True:
+            try:
+                copied = await self.mirror_once(check_sheet)
+                check_sheet = False
+            except Exception as e:
+                logger.error(f"Sheet mirror failed, will retry: {e}")
+                check_sheet = True
+                copied = 0
+            try:
+                self.unsynced = await asyncio.to_thread(self._count_unsynced)
+            except Exception as e:
+                logger.error(f"Failed to count unmirrored ballots: {e}")
+            if copied < self.mirror_batch:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.mirror_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def start(self):
+        if self.writer is not None and self._task is None:
+            self.writer.start()
+            self._task = asyncio.get_running_loop().create_task(self._mirror())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await self.writer.stop()
+        with self._lock:
+            self._db.close()
+
+
+class CSVStorage:
+    """Ballots appended to a local CSV file, one fsync per group of concurrent ballots.
+
+    Meant for offline elections and rehearsals; nothing is sent to the sheet.
+    """
+
+    writer = None
+    sheets = None
+    unsynced = 0
+    degraded = False
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = list(columns)
+        self._commits = GroupCommit(self._write)
+        self._file = None
+
+    @property
+    def ready(self):
+        return self._file is not None
+
+    def _write(self, records):
+        buffer = io.StringIO()
+        csv.DictWriter(buffer, self.columns, extrasaction='ignore').writerows(records)
+        self._file.write(buffer.getvalue())
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    async def store(self, chat_id, record):
+        key = ballot_key(chat_id, record)
+        await self._commits.submit(dict(record, **{BALLOT_ID_HEADER: key}))
+        return key
+
+    def _read(self):
+        with open(self.path, newline='') as f:
+            return list(csv.DictReader(f))
+
+    async def stored_records(self):
+        return await asyncio.to_thread(self._read)
+
+    def start(self):
+        if self._file is None:
+            new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            self._file = open(self.path, 'a', newline='')
+            if new:
+                csv.writer(self._file).writerow(self.columns)
+                self._file.flush()
+
+    async def stop(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
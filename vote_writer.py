@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class VoteWriter:
+    """Background task that groups completed ballots into append_rows batches.
+
+    Handlers enqueue a record and get back a future that resolves to True once
+    the batch holding it is committed to the sheet, or False if it failed.
+    One writer can serve several elections' sheets: a record may name the
+    SheetsClient it goes to, and each batch is split into one append_rows per
+    sheet. Every storage using the writer starts and stops it, and it keeps
+    running until the last one stops.
+    """
+
+    def __init__(self, sheets=None, max_queue=1000, batch_size=50, batch_window=0.5):
+        self.sheets = sheets
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.batches = 0
+        self.committed = 0
+        self.failed = 0
+        self.last_batch_size = 0
+        self.last_batch_latency = 0.0
+        self.total_batch_latency = 0.0
+        self._batch_ready = asyncio.Event()
+        self._task = None
+        self._users = 0
+
+    @property
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    @property
+    def mean_batch_latency(self):
+        return self.total_batch_latency / self.batches if self.batches else 0.0
+
+    async def submit(self, record, sheets=None):
+        """Queue a record for `sheets` (default: the writer's own), waiting if the queue is full.
+
+        Returns a future for its commit.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((record, future, sheets or self.sheets))
+        if self.queue.qsize() >= self.batch_size:
+            self._batch_ready.set()
+        return future
+
+    async def _next_batch(self):
+        """Wait for one item, then up to batch_window for the batch to fill."""
+        first = await self.queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        if self.queue.qsize() < self.batch_size - 1:
+            self._batch_ready.clear()
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.batch_window)
+            except asyncio.TimeoutError:
+                pass
+        stopping = False
+        while len(batch) < self.batch_size and not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is _STOP:
+                stopping = True
+                break
+            batch.append(item)
+        return batch, stopping
+
+    async def _commit(self, batch):
+        by_sheet = {}
+        for item in batch:
+            by_sheet.setdefault(item[2], []).append(item)
+        for sheets, items in by_sheet.items():
+            await self._commit_to(sheets, items)
+
+    async def _commit_to(self, sheets, batch):
+        started = time.monotonic()
+        try:
+            await sheets.run(sheets.append_records, [record for record, _, _ in batch])
+            ok = True
+            self.committed += len(batch)
+        except Exception as e:
+            logger.error(f"Failed to store batch of {len(batch)} votes: {e}")
+            ok = False
+            self.failed += len(batch)
+        latency = time.monotonic() - started
+        self.batches += 1
+        self.last_batch_size = len(batch)
+        self.last_batch_latency = latency
+        self.total_batch_latency += latency
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_result(ok)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._next_batch()
+            if batch:
+                await self._commit(batch)
+        # Anything submitted after stop() was requested still gets written.
+        leftover = [item for item in _drain(self.queue) if item is not _STOP]
+        for i in range(0, len(leftover), self.batch_size):
+            await self._commit(leftover[i:i + self.batch_size])
+
+    def start(self):
+        self._users += 1
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Commit whatever is still queued, then stop the background task once no storage uses it."""
+        self._users -= 1
+        if self._users > 0:
+            return
+        if self._task is not None:
+            await self.queue.put(_STOP)
+            self._batch_ready.set()
+            await self._task
+            self._task = None
+
+
+def _drain(queue):
+    while not queue.empty():
+        yield queue.get_nowait()
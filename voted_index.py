@@ -0,0 +1,267 @@
+import asyncio
+import hashlib
+import logging
+import math
+import sqlite3
+import threading
+
+from tracing import span
+from voter_registry import normalize_email
+
+logger = logging.getLogger(__name__)
+
+EMAIL = 'e'
+CHAT = 'c'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS voted (
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (kind, value)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS pending_claims (
+    email TEXT PRIMARY KEY,
+    chat TEXT NOT NULL,
+    chat_id INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter; never gives false negatives."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        a = int.from_bytes(digest[:8], 'little')
+        b = int.from_bytes(digest[8:], 'little') | 1
+        return ((a + i * b) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class VotedIndex:
+    """Who has already voted, by normalized email and by chat ID, persisted in SQLite.
+
+    Membership is answered from memory in O(1). With `compact=True` only a
+    Bloom filter is kept in memory and positives are confirmed in SQLite, so
+    very large rosters cost a few bits per voter instead of a Python set.
+    With `shared=True` other processes claim voters in the same database, so
+    a miss in memory is confirmed in SQLite; claims are atomic either way.
+    Elections hosted in one process share the table, each under its own
+    `namespace`.
+
+    A claim stays pending until confirm() records that its ballot is stored.
+    Claims a killed process left pending are resolved by reconcile() against
+    the stored ballots, so a crash between claim and store never locks a voter
+    out.
+    """
+
+    def __init__(self, path='bot_state.db', compact=False, capacity=100000, shared=False, namespace=''):
+        self.path = path
+        self.compact = compact
+        self.shared = shared
+        self._prefix = f"{namespace}:" if namespace else ''
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+        self._bloom = BloomFilter(capacity) if compact else None
+        self._members = None if compact else set()
+        self._count = 0
+        self._stale = []
+
+    def __len__(self):
+        return self._count
+
+    def load(self):
+        """Load every stored entry into the in-memory front."""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT kind, value FROM voted WHERE substr(value, 1, ?) = ?', (len(self._prefix), self._prefix)
+            ).fetchall()
+            # Claims left pending when this loads were made by a process that has since stopped,
+            # or in scale-out by another worker, which reconcile() leaves to that worker's shard.
+            self._stale = self._db.execute(
+                'SELECT email, chat, chat_id FROM pending_claims WHERE substr(email, 1, ?) = ?',
+                (len(self._prefix), self._prefix)
+            ).fetchall()
+        for kind, value in rows:
+            self._remember(kind + value)
+        logger.info(f"Loaded {len(rows)} voted-index entries from {self.path}, {len(self._stale)} claims pending.")
+
+    def _remember(self, item):
+        if self.compact:
+            self._bloom.add(item)
+        else:
+            self._members.add(item)
+        if item[0] == EMAIL:
+            self._count += 1
+
+    def _forget(self, item):
+        if not self.compact and item in self._members:
+            self._members.discard(item)
+            if item[0] == EMAIL:
+                self._count -= 1
+
+    def _contains(self, kind, value):
+        item = kind + value
+        if self.compact:
+            if item not in self._bloom and not self.shared:
+                return False
+        elif item in self._members:
+            return True
+        elif not self.shared:
+            return False
+        with self._lock:
+            row = self._db.execute('SELECT 1 FROM voted WHERE kind = ? AND value = ?', (kind, value)).fetchone()
+        if row is not None and self.shared:
+            self._remember(item)
+        return row is not None
+
+    def _email(self, email):
+        return self._prefix + normalize_email(email)
+
+    def _chat(self, chat_id):
+        return self._prefix + str(chat_id)
+
+    def has_voted(self, email=None, chat_id=None):
+        if email is not None and self._contains(EMAIL, self._email(email)):
+            return True
+        return chat_id is not None and self._contains(CHAT, self._chat(chat_id))
+
+    def _insert_claim(self, email_entry, chat_entry, chat_id):
+        with span('voted.claim'), self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._db.execute('INSERT INTO voted (kind, value) VALUES (?, ?)', email_entry)
+                self._db.execute('INSERT OR IGNORE INTO voted (kind, value) VALUES (?, ?)', chat_entry)
+                self._db.execute(
+                    'INSERT OR REPLACE INTO pending_claims (email, chat, chat_id) VALUES (?, ?, ?)',
+                    (email_entry[1], chat_entry[1], chat_id)
+                )
+            except sqlite3.IntegrityError:
+                self._db.execute('ROLLBACK')
+                return False
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+            return True
+
+    def _delete(self, entries):
+        with self._lock:
+            self._db.execute('BEGIN')
+            self._db.executemany('DELETE FROM voted WHERE kind = ? AND value = ?', entries)
+            self._db.executemany(
+                'DELETE FROM pending_claims WHERE email = ?', [(value,) for kind, value in entries if kind == EMAIL]
+            )
+            self._db.execute('COMMIT')
+
+    def _settle(self, emails):
+        with self._lock:
+            self._db.executemany('DELETE FROM pending_claims WHERE email = ?', [(email,) for email in emails])
+
+    async def claim(self, email, chat_id):
+        """Atomically mark a voter as having voted. Returns False if they already had."""
+        if self.has_voted(email, chat_id):
+            return False
+        email_entry, chat_entry = (EMAIL, self._email(email)), (CHAT, self._chat(chat_id))
+        # The in-memory front is updated before awaiting, so a concurrent claim in this process sees it;
+        # the database insert settles races with other processes.
+        for kind, value in (email_entry, chat_entry):
+            self._remember(kind + value)
+        try:
+            claimed = await asyncio.to_thread(self._insert_claim, email_entry, chat_entry, chat_id)
+        except Exception:
+            self._forget(email_entry[0] + email_entry[1])
+            self._forget(chat_entry[0] + chat_entry[1])
+            raise
+        if not claimed:
+            # Someone else claimed this email first; only the email is known to have voted.
+            self._forget(chat_entry[0] + chat_entry[1])
+        return claimed
+
+    async def confirm(self, email):
+        """Mark a claim as settled once its ballot is stored."""
+        await asyncio.to_thread(self._settle, [self._email(email)])
+
+    async def reconcile(self, records, owns=None):
+        """Settle claims left pending by a stopped process: keep those with a stored ballot, release the rest.
+
+        `records` are every stored ballot; `owns(chat_id)` limits this to the chats this process serves.
+        """
+        stale = [claim for claim in self._stale if owns is None or owns(claim[2])]
+        self._stale = []
+        if not stale:
+            return
+        stored = {self._email(record.get('Email', '')) for record in records}
+        kept = [email for email, _, _ in stale if email in stored]
+        lost = [(email, chat) for email, chat, _ in stale if email not in stored]
+        if kept:
+            await asyncio.to_thread(self._settle, kept)
+        if lost:
+            entries = [(kind, value) for email, chat in lost for kind, value in ((EMAIL, email), (CHAT, chat))]
+            if self.compact:
+                # The Bloom filter cannot forget, but its positives are confirmed in SQLite.
+                self._count -= len(lost)
+            for kind, value in entries:
+                self._forget(kind + value)
+            await asyncio.to_thread(self._delete, entries)
+        logger.info(f"Settled {len(stale)} pending claims: released {len(lost)} whose ballots were never stored.")
+
+    async def release(self, email, chat_id):
+        """Undo a claim whose ballot could not be stored."""
+        entries = [(EMAIL, self._email(email)), (CHAT, self._chat(chat_id))]
+        if not self.compact:
+            for kind, value in entries:
+                self._members.discard(kind + value)
+        self._count -= 1
+        await asyncio.to_thread(self._delete, entries)
+
+    def _insert_new(self, records):
+        """Insert the voters in `records` that are not stored yet, in one transaction; returns those that were new."""
+        entries = []
+        for record in records:
+            email, chat_id = record.get('Email', ''), record.get('Chat ID', '')
+            if email:
+                entries.append((EMAIL, self._email(email)))
+            if chat_id:
+                entries.append((CHAT, self._chat(chat_id)))
+        added = []
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                for entry in entries:
+                    if self._db.execute('INSERT OR IGNORE INTO voted (kind, value) VALUES (?, ?)', entry).rowcount:
+                        added.append(entry)
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+        return added
+
+    async def seed(self, records, chunk=1000):
+        """Add voters from stored ballot records ({column: value} dicts) that are not indexed yet."""
+        # SQLite decides what is new, off the event loop; in compact mode checking each record
+        # against the front would run a confirming query per record on the loop.
+        added = await asyncio.to_thread(self._insert_new, records)
+        for start in range(0, len(added), chunk):
+            for kind, value in added[start:start + chunk]:
+                self._remember(kind + value)
+            await asyncio.sleep(0)
+        logger.info(f"Voted index seeded from storage: {len(added)} new entries, {self._count} voters.")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
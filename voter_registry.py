@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import sqlite3
+import threading
+import unicodedata
+
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+ROSTER_DB = 'roster.db'
+LEGACY_ROSTER_FILES = ('voter_emails.json', 'voter_names.json', 'verification_codes.json')
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+def fold_name(name):
+    """Case- and whitespace-insensitive form of a name, so "  jane  SMITH" matches "Jane Smith"."""
+    return ' '.join(unicodedata.normalize('NFKC', name).casefold().split())
+
+
+def hash_code(salt, email, code):
+    """Keyed hash of a verification code, bound to the voter's normalized email."""
+    message = normalize_email(email).encode() + b'\0' + code.strip().upper().encode()
+    return hashlib.blake2b(message, key=salt, digest_size=16).digest()
+
+
+class VoterRegistry:
+    """Voter index keyed by normalized email, read from the SQLite roster built by roster_import.py.
+
+    Lookups are primary-key reads, so the roster is never loaded into memory.
+    An import swaps in a new file atomically; the watcher notices and reopens it.
+    If `refresh` is given, the watcher first calls it in a worker thread so it
+    can rebuild the store from a source the roster is maintained in.
+    """
+
+    def __init__(self, path=ROSTER_DB, poll_interval=30, refresh=None):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.refresh = refresh
+        # Lookups run on the event loop and in worker threads; the connection is swapped and closed under it.
+        self._lock = threading.Lock()
+        self._db = None
+        self._salt = b''
+        self._count = 0
+        self._stamp = None
+        self._task = None
+
+    def _read_stamp(self):
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _open(self):
+        stamp = self._read_stamp()
+        db = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+        meta = dict(db.execute('SELECT key, value FROM meta'))
+        return db, bytes.fromhex(meta['salt']), int(meta['count']), stamp
+
+    def _swap(self, opened):
+        with self._lock:
+            old = self._db
+            self._db, self._salt, self._count, self._stamp = opened
+            if old is not None:
+                old.close()
+
+    def load(self):
+        """Open the roster synchronously. Raises if it cannot be read."""
+        self._swap(self._open())
+        logger.info(f"Loaded roster of {self._count} voters from {self.path}.")
+
+    def _lookup(self, email):
+        """(folded name, code hash, salt) for a registered email, all read from the same roster."""
+        with span('roster.lookup'), self._lock:
+            row = self._db.execute(
+                'SELECT name_key, code_hash FROM voters WHERE email = ?', (normalize_email(email),)
+            ).fetchone()
+            return row, self._salt
+
+    def lookup(self, email):
+        """Return (folded name, code hash) for a registered email, or None."""
+        return self._lookup(email)[0]
+
+    def verify(self, email, name, code):
+        """Whether the email is registered with this name and verification code."""
+        row, salt = self._lookup(email)
+        supplied = hash_code(salt, email, code)
+        if row is None:
+            return False
+        name_ok = hmac.compare_digest(row[0].encode(), fold_name(name).encode())
+        return hmac.compare_digest(row[1], supplied) and name_ok
+
+    def __contains__(self, email):
+        return self.lookup(email) is not None
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def loaded(self):
+        return self._stamp is not None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                if self.refresh is not None:
+                    await asyncio.to_thread(self.refresh)
+                stamp = await asyncio.to_thread(self._read_stamp)
+                if stamp == self._stamp:
+                    continue
+                opened = await asyncio.to_thread(self._open)
+            except Exception as e:
+                logger.error(f"Failed to reload the roster, keeping the previous one: {e}")
+                continue
+            self._swap(opened)
+            logger.info(f"Reloaded roster of {self._count} voters.")
+
+    def start(self):
+        """Start watching the roster file. Must be called from the running event loop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None